@@ -2,9 +2,10 @@ from gevent import monkey
 monkey.patch_all()
 import io
 from gevent.pool import Pool
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, send_file, abort
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, send_file, abort, Response
 from flask_socketio import SocketIO, join_room, leave_room
-from db_manager import DBManager, run_python, run_cpp, run_csharp
+from db_manager import (DBManager, run_python, run_cpp, run_csharp, container_pool, compile_cache, verdict_cache,
+                        test_set_store, set_output_limit)
 import os
 import time
 from flask import session
@@ -15,14 +16,20 @@ import pandas as pd
 import zipfile
 import re
 import json
-from threading import Lock, Semaphore 
-from gevent.queue import Queue
+import gzip
+import hashlib
+from threading import Lock, RLock
+from gevent.event import AsyncResult
+from submission_scheduler import SubmissionScheduler, LANE_ADMIN, LANE_CONTEST
+from remote_workers import remote_workers, WorkerLost
+from scoreboard_index import RankingIndex
+from write_behind import WriteBehindWriter
 from werkzeug.security import check_password_hash
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 import gevent 
 from datetime import datetime
-submission_queue = Queue()
+submission_queue = SubmissionScheduler()
 
 socketio = SocketIO(app, async_mode='gevent')
 
@@ -36,6 +43,9 @@ def add_header(response):
     # Если запрос идет к папке static, разрешаем кэш
     if request.path.startswith('/static'):
         response.headers['Cache-Control'] = 'public, max-age=3600'
+    elif response.headers.get('ETag'):
+        # Ответ с ETag: браузер хранит копию, но каждый раз сверяется (If-None-Match -> 304)
+        response.headers['Cache-Control'] = 'no-cache'
     else:
         # Для остальных запросов (HTML, API) запрещаем кэш
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
@@ -79,25 +89,141 @@ except (configparser.NoSectionError, configparser.NoOptionError) as e:
     ADMIN_PASSWORD = 'admin'
     MAX_CONCURRENT_CHECKS = 10
 check_pool = Pool(MAX_CONCURRENT_CHECKS)
+
+# Пул тёплых контейнеров: до MAX_CHECKS свободных на образ, при старте поднимаем WARM_CONTAINERS
+USE_CONTAINER_POOL = config.getboolean('server', 'CONTAINER_POOL', fallback=True)
+WARM_CONTAINERS = config.getint('server', 'WARM_CONTAINERS', fallback=max(1, MAX_CONCURRENT_CHECKS // 3))
+if USE_CONTAINER_POOL:
+    container_pool.configure(MAX_CONCURRENT_CHECKS)
+
+# Кэш компиляции C++/C# (размер в МБ, 0 - выключен)
+compile_cache.configure(config.getint('server', 'COMPILE_CACHE_MB', fallback=256))
+
+# Общие read-only наборы тестов на диске (размер в МБ)
+test_set_store.configure(config.getint('server', 'TEST_DATA_MB', fallback=1024))
+
+# Лимит вывода программы на тест (МБ), дальше - Output Limit Exceeded
+set_output_limit(config.getint('server', 'OUTPUT_LIMIT_MB', fallback=64))
+
+# Параллельный прогон тестов: задача с >= PARALLEL_MIN_TESTS тестами делится на PARALLEL_TESTS потоков
+PARALLEL_TESTS = max(1, min(config.getint('server', 'PARALLEL_TESTS', fallback=1), os.cpu_count() or 1))
+PARALLEL_MIN_TESTS = config.getint('server', 'PARALLEL_MIN_TESTS', fallback=10)
+
+def _get_test_workers(test_count):
+    """Сколько тестов одной посылки запускать одновременно."""
+    if PARALLEL_TESTS > 1 and test_count >= PARALLEL_MIN_TESTS:
+        return PARALLEL_TESTS
+    return 1
+
+# Кэш вердиктов: повторная отправка того же кода на те же тесты не запускает песочницу (0 - выключен)
+verdict_cache.configure(config.getint('server', 'VERDICT_CACHE_SIZE', fallback=2000))
+
+# Удаленные проверяющие машины (judge_worker.py). Пустой WORKER_TOKEN - выключено
+remote_workers.configure(config.get('server', 'WORKER_TOKEN', fallback=''),
+                         config.getint('server', 'WORKER_TIMEOUT', fallback=15))
+WORKER_POLL_SECONDS = 20
+# Запас к сумме лимитов тестов: компиляция, запуск контейнера, сеть
+WORKER_JOB_MARGIN = config.getint('server', 'WORKER_JOB_MARGIN', fallback=60)
+
+def _run_with_verdict_cache(runner, task_id, tests_version, use_cache, language, code, test_data_list,
+                            checker_code=None, stop_on_failure=False, schedule=None, remote=None, test_set_id=None,
+                            on_progress=None):
+    """
+    Запускает раннер через кэш вердиктов.
+    schedule(fn) - как выполнить запуск (например, через админскую полосу очереди).
+    remote - удаленный воркер, которому отдается запуск вместо локального Docker.
+    test_set_id - хэш набора тестов (из get_judge_data), чтобы не пересчитывать его на каждый запуск.
+    on_progress(record) - результат каждого теста по мере прогона (только локальный Docker).
+    Возвращает (verdicts, global_err, from_cache).
+    """
+    cache_key = None
+    if use_cache and verdict_cache.enabled:
+        cache_key = verdict_cache.make_key(language, code, task_id, tests_version, checker_code, stop_on_failure)
+        cached = verdict_cache.get(cache_key)
+        if cached is not None:
+            print(f"VERDICT CACHE: Попадание для задачи {task_id} ({language})")
+            return cached, None, True
+
+    def run():
+        return runner(code, test_data_list, checker_code=checker_code,
+                      workers=_get_test_workers(len(test_data_list)),
+                      stop_on_failure=stop_on_failure, test_set_id=test_set_id, on_progress=on_progress)
+
+    if remote is not None:
+        # Дедлайн задания: если воркер не вернул результат, посылка уйдет в очередь заново
+        deadline = sum(float(t.get('limit', 1.0)) for t in test_data_list) + WORKER_JOB_MARGIN
+        verdicts, global_err = remote_workers.execute(remote, {
+            'language': language,
+            'code': code,
+            'tests': test_data_list,
+            'test_set_id': test_set_id,
+            'checker_code': checker_code,
+            'workers': _get_test_workers(len(test_data_list)),
+            'stop_on_failure': stop_on_failure
+        }, deadline=deadline)
+    else:
+        verdicts, global_err = schedule(run) if schedule else run()
+
+    if cache_key and not global_err:
+        verdict_cache.put(cache_key, verdicts)
+    return verdicts, global_err, False
 if ADMIN_PASSWORD == "commandblock2025" or ADMIN_PASSWORD == "admin":
      print("WARNING: Вы используете пароль администратора по умолчанию. Обязательно смените его в config.ini")
 
-db = DBManager()
+# Пул соединений SQLite (DB_POOL_SIZE одновременных запросов к БД)
+db = DBManager(pool_size=config.getint('server', 'DB_POOL_SIZE', fallback=8))
+
+# Отложенная запись результатов: измененные участники пишутся пачкой раз в WRITE_BEHIND_MS
+persistence = WriteBehindWriter(db)
+persistence.configure(config.getint('server', 'WRITE_BEHIND_MS', fallback=200),
+                      config.getint('server', 'WRITE_BEHIND_MAX_ROWS', fallback=500))
+
+# Кэш тестов и чекеров для проверки (размер в МБ тестов)
+db.judge_cache.configure(config.getint('server', 'TASK_CACHE_MB', fallback=256))
+
+def _prewarm_judge_data(task_ids):
+    """Тесты и чекеры задач олимпиады загружаются в кэш в фоне, до первых посылок."""
+    gevent.spawn(db.prewarm_judge_data, list(task_ids))
+
 olympiads = {}
-olympiad_lock = Lock() 
-docker_check_semaphore = Semaphore(MAX_CONCURRENT_CHECKS)
+# olympiad_lock защищает сам словарь olympiads (создание, удаление, обход всех олимпиад).
+# Состояние одной олимпиады защищается ее собственной блокировкой (_get_olympiad_lock),
+# поэтому медленная операция в одной олимпиаде не тормозит остальные.
+# Порядок захвата: olympiad_lock -> блокировка олимпиады, никогда наоборот.
+olympiad_lock = RLock() 
+olympiad_locks = {}
+_olympiad_locks_guard = Lock()
+
+def _get_olympiad_lock(olympiad_id):
+    """
+    Блокировка состояния одной олимпиады.
+    Для несуществующей олимпиады возвращается общая olympiad_lock,
+    чтобы произвольные ID из запросов не плодили блокировки.
+    """
+    lock = olympiad_locks.get(olympiad_id)
+    if lock is not None:
+        return lock
+    if olympiad_id not in olympiads:
+        return olympiad_lock
+    with _olympiad_locks_guard:
+        return olympiad_locks.setdefault(olympiad_id, RLock())
 
 def _get_admin_room_name(olympiad_id):
     """Get the admin-only SocketIO room name."""
     return f"{olympiad_id}_admin"
 
+def _get_participant_room_name(olympiad_id, participant_id):
+    """Личная комната участника: события о его посылках (прогресс тестов)."""
+    return f"{olympiad_id}_p_{participant_id}"
+
 def _is_olympiad_frozen(olympiad_id):
     """
     Check if an olympiad is currently in freeze mode.
     Returns True if frozen, False otherwise.
-    Thread-safe: uses olympiad_lock internally.
+    Thread-safe: takes the per-olympiad lock from _get_olympiad_lock
+    (the global olympiad_lock only for unknown olympiad IDs).
     """
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads:
             return False
         
@@ -117,6 +243,143 @@ def _is_olympiad_frozen(olympiad_id):
         freeze_threshold_seconds = freeze_minutes * 60
         return remaining_seconds <= freeze_threshold_seconds
 
+# === РАССЫЛКА ТАБЛИЦЫ ===
+# Все изменения олимпиады за BROADCAST_WINDOW сливаются в одну рассылку
+# (маскированная - в комнату олимпиады, полная - в комнату организаторов).
+#
+# Протокол: при входе клиент получает снимок full_status_update с полями view и seq,
+# дальше - только scoreboard_delta со следующим seq: измененные строки (rows),
+# новые места (ranks: participant_id -> позиция), удаленные строки (removed)
+# и изменившиеся поля состояния (meta). При пропуске seq клиент шлет request_resync.
+BROADCAST_WINDOW = max(0, config.getint('server', 'BROADCAST_WINDOW_MS', fallback=300)) / 1000.0
+pending_broadcasts = set()
+broadcast_lock = Lock()
+
+VIEW_PUBLIC = 'public'
+VIEW_ADMIN = 'admin'
+# (olympiad_id, view) -> последнее разосланное состояние
+scoreboard_streams = {}
+streams_lock = Lock()
+# Поля, которые меняются сами по себе и не повод для рассылки
+_VOLATILE_STATE_KEYS = {'remaining_seconds'}
+
+def _schedule_broadcast(olympiad_id):
+    """Планирует рассылку таблицы. Повторные вызовы в пределах окна ничего не добавляют."""
+    if BROADCAST_WINDOW <= 0:
+        _flush_broadcast(olympiad_id)
+        return
+    with broadcast_lock:
+        if olympiad_id in pending_broadcasts:
+            return
+        pending_broadcasts.add(olympiad_id)
+    gevent.spawn_later(BROADCAST_WINDOW, _flush_broadcast, olympiad_id)
+
+def _flush_broadcast(olympiad_id):
+    # Снимаем отметку до расчета: изменения во время расчета запланируют новую рассылку
+    with broadcast_lock:
+        pending_broadcasts.discard(olympiad_id)
+    try:
+        # Один emit на комнату - пакет кодируется один раз для всех сокетов
+        _emit_scoreboard_delta(olympiad_id, VIEW_PUBLIC, olympiad_id)
+        _emit_scoreboard_delta(olympiad_id, VIEW_ADMIN, _get_admin_room_name(olympiad_id))
+    except Exception as e:
+        print(f"BROADCAST ERROR: {e}")
+
+def _emit_scoreboard_delta(olympiad_id, view, room):
+    """Сравнивает состояние с последним разосланным и отправляет в комнату только разницу."""
+    state = _get_olympiad_state(olympiad_id, is_admin=(view == VIEW_ADMIN))
+    if not state:
+        return
+    # Строки таблицы - снимки (_participant_row), их можно хранить как есть.
+    # Живой здесь только словарь first_solves (он меняется на месте) - копируем его
+    state = dict(state, first_solves=dict(state.get('first_solves') or {}))
+    rows = {p['participant_id']: p for p in state.pop('scoreboard')}
+    order = list(rows)
+
+    with streams_lock:
+        stream = scoreboard_streams.get((olympiad_id, view))
+        if stream is None:
+            stream = scoreboard_streams[(olympiad_id, view)] = {'seq': 0, 'rows': {}, 'ranks': {}, 'meta': {}}
+
+        old_rows, old_ranks, old_meta = stream['rows'], stream['ranks'], stream['meta']
+        changed = [row for pid, row in rows.items() if old_rows.get(pid) != row]
+        ranks = {pid: i for i, pid in enumerate(order) if old_ranks.get(pid) != i}
+        removed = [pid for pid in old_rows if pid not in rows]
+        meta = {k: v for k, v in state.items() if old_meta.get(k) != v}
+
+        if not changed and not ranks and not removed and set(meta) <= _VOLATILE_STATE_KEYS:
+            return
+
+        stream['seq'] += 1
+        stream['rows'] = rows
+        stream['ranks'] = {pid: i for i, pid in enumerate(order)}
+        stream['meta'] = state
+        socketio.emit('scoreboard_delta', {
+            'view': view,
+            'seq': stream['seq'],
+            'rows': changed,
+            'ranks': ranks,
+            'removed': removed,
+            'meta': meta
+        }, to=room)
+
+def _drop_scoreboard_streams(olympiad_id):
+    with streams_lock:
+        for view in (VIEW_PUBLIC, VIEW_ADMIN):
+            scoreboard_streams.pop((olympiad_id, view), None)
+
+def _send_scoreboard_snapshot(olympiad_id, view, sid):
+    """Полный снимок таблицы одному клиенту (вход в комнату или resync)."""
+    state = _get_olympiad_state(olympiad_id, is_admin=(view == VIEW_ADMIN))
+    if not state:
+        return
+    with streams_lock:
+        stream = scoreboard_streams.get((olympiad_id, view))
+        seq = stream['seq'] if stream else 0
+    socketio.emit('full_status_update', {**state, 'view': view, 'seq': seq}, to=sid)
+
+def _olympiad_timing(oly):
+    """
+    (remaining_seconds, is_frozen, needs_update) для олимпиады.
+    needs_update=True - пора запустить заморозку или завершить олимпиаду по времени.
+    """
+    remaining_seconds = 0
+    is_frozen = False
+    needs_update = False
+    freeze_minutes = oly['config'].get('freeze_minutes', 0)
+
+    if oly['status'] == 'running' and oly.get('start_time'):
+        elapsed = time.time() - oly['start_time']
+        duration_sec = oly['config']['duration_minutes'] * 60
+        remaining_seconds = max(0, duration_sec - elapsed)
+
+        if freeze_minutes > 0 and remaining_seconds <= freeze_minutes * 60:
+            is_frozen = True
+            if not oly.get('freeze_triggered', False):
+                needs_update = True
+        if remaining_seconds <= 0:
+            needs_update = True
+    return remaining_seconds, is_frozen, needs_update
+
+def _response_from_snapshot(oly, snapshot, is_admin):
+    """Ответ из опубликованного cached_state. None - снимок нельзя отдать без обновления."""
+    remaining_seconds, is_frozen, needs_update = _olympiad_timing(oly)
+    if needs_update:
+        return None
+    response = snapshot.copy()
+    response['remaining_seconds'] = remaining_seconds
+    response['status'] = oly['status']
+    response['first_solves'] = oly['first_solves']
+    response['is_frozen'] = is_frozen
+    response['freeze_minutes'] = oly['config'].get('freeze_minutes', 0)
+    # If frozen AND not admin, apply freeze mask for spectator view
+    # (cached_state уже содержит живую таблицу - пересчитывать ее не нужно,
+    # а админ видит ее как есть)
+    if is_frozen and not is_admin and oly.get('frozen_scoreboard'):
+        # Apply mask: show old scores, new attempts, pending indicators
+        response['scoreboard'] = _get_masked_scoreboard(oly, response['scoreboard'])
+    return response
+
 def _get_olympiad_state(olympiad_id, is_admin=False):
     """
     ОПТИМИЗИРОВАННАЯ ВЕРСИЯ: Использует кэш.
@@ -124,8 +387,19 @@ def _get_olympiad_state(olympiad_id, is_admin=False):
     [FIX] Добавлена нормализация ключей scores (str), чтобы избежать ошибки JSON sort.
     [FREEZE] Добавлена поддержка заморозки таблицы в стиле ICPC.
     [ADMIN] is_admin=True возвращает немаскированные данные (для организаторов).
+    [SNAPSHOT] Если cached_state актуален, читатели не берут блокировку олимпиады:
+    cached_state только заменяется целиком, но никогда не изменяется на месте.
     """
-    with olympiad_lock:
+    oly = olympiads.get(olympiad_id)
+    if oly is None:
+        return None
+    snapshot = oly.get('cached_state')
+    if snapshot is not None and not oly.get('is_dirty', True) and 'first_solves' in oly:
+        response = _response_from_snapshot(oly, snapshot, is_admin)
+        if response is not None:
+            return response
+
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads:
             return None 
         
@@ -133,49 +407,23 @@ def _get_olympiad_state(olympiad_id, is_admin=False):
         if 'first_solves' not in oly:
             oly['first_solves'] = db.get_first_solvers(olympiad_id)
 
-        remaining_seconds = 0
-        is_frozen = False
+        remaining_seconds, is_frozen, needs_update = _olympiad_timing(oly)
         freeze_minutes = oly['config'].get('freeze_minutes', 0)
         
-        if oly['status'] == 'running' and oly.get('start_time'):
-            elapsed = time.time() - oly['start_time']
-            duration_sec = oly['config']['duration_minutes'] * 60
-            remaining_seconds = max(0, duration_sec - elapsed)
-            
-            # Check if freeze should be triggered
-            if freeze_minutes > 0:
-                freeze_threshold_seconds = freeze_minutes * 60
-                if remaining_seconds <= freeze_threshold_seconds:
-                    is_frozen = True
-                    # Save frozen scoreboard snapshot once when freeze is first triggered
-                    if not oly.get('freeze_triggered', False):
-                        oly['freeze_triggered'] = True
-                        oly['freeze_time'] = time.time()  # Record when freeze happened
-                        # Compute and save the frozen scoreboard
-                        frozen_board = _compute_scoreboard(oly)
-                        oly['frozen_scoreboard'] = frozen_board
+        if needs_update:
+            # Save frozen scoreboard snapshot once when freeze is first triggered
+            if is_frozen and not oly.get('freeze_triggered', False):
+                oly['freeze_triggered'] = True
+                oly['freeze_time'] = time.time()  # Record when freeze happened
+                # Compute and save the frozen scoreboard
+                frozen_board = _compute_scoreboard(oly)
+                oly['frozen_scoreboard'] = frozen_board
             
             if remaining_seconds <= 0:
                 oly['status'] = 'finished'
 
-
         if not oly.get('is_dirty', True) and oly.get('cached_state'):
-            response = oly['cached_state'].copy()
-            response['remaining_seconds'] = remaining_seconds
-            response['status'] = oly['status'] 
-            response['first_solves'] = oly['first_solves']
-            response['is_frozen'] = is_frozen
-            response['freeze_minutes'] = freeze_minutes
-            # If frozen AND not admin, apply freeze mask for spectator view
-            if is_frozen and not is_admin and oly.get('frozen_scoreboard'):
-                frozen_scoreboard = oly['frozen_scoreboard']
-                live_scoreboard = _compute_scoreboard(oly)
-                # Apply mask: show old scores, new attempts, pending indicators
-                response['scoreboard'] = _apply_freeze_mask(frozen_scoreboard, live_scoreboard)
-            elif is_frozen and is_admin:
-                # Admin sees live data even during freeze
-                response['scoreboard'] = _compute_scoreboard(oly)
-            return response
+            return _response_from_snapshot(oly, oly['cached_state'], is_admin)
 
         oly_data_copy = {
             'status': oly['status'],
@@ -198,6 +446,7 @@ def _get_olympiad_state(olympiad_id, is_admin=False):
         }
         oly['cached_state'] = state_to_cache
         oly['is_dirty'] = False
+        oly['state_version'] = oly.get('state_version', 0) + 1
         
         response = state_to_cache.copy()
         response['remaining_seconds'] = remaining_seconds
@@ -206,60 +455,96 @@ def _get_olympiad_state(olympiad_id, is_admin=False):
         
         # If frozen AND not admin, apply freeze mask for spectator view
         if is_frozen and not is_admin and oly.get('frozen_scoreboard'):
-            frozen_scoreboard = oly['frozen_scoreboard']
-            live_scoreboard = response['scoreboard']
             # Apply mask: show old scores, new attempts, pending indicators
-            response['scoreboard'] = _apply_freeze_mask(frozen_scoreboard, live_scoreboard)
+            response['scoreboard'] = _get_masked_scoreboard(oly, response['scoreboard'])
         elif is_frozen and is_admin:
             # Admin sees live data even during freeze (already computed)
             pass
         
         return response
 
-def _compute_scoreboard(oly):
-    """Helper function to compute scoreboard from olympiad data."""
-    scoreboard = []
-    scoring_mode = oly['config'].get('scoring', 'all_or_nothing')
-    
-    for p_id, p_data in oly['participants'].items(): 
-        total_score = 0
-        total_penalty = 0
-        
-        # [FIX] Нормализация ключей: превращаем все ID задач в строки
-        # Это предотвращает ошибку TypeError при jsonify (смесь int и str)
-        normalized_scores = {}
-        for k, v in p_data['scores'].items():
-            str_key = str(k)
-            # [FIX] Гарантируем, что все ключи в v тоже нормализованы
-            if isinstance(v, dict):
-                normalized_scores[str_key] = v
-            else:
-                normalized_scores[str_key] = {'score': 0, 'attempts': 0, 'passed': False, 'penalty': 0}
-
-        if scoring_mode == 'icpc':
-            # Fix: In ICPC mode, total_score should count solved problems (number of problems with passed=True)
-            total_score = sum(1 for s in normalized_scores.values() if s.get('passed'))
-            total_penalty = sum(s.get('penalty', 0) for s in normalized_scores.values() if s.get('passed'))
+def _participant_row(p_id, p_data, scoring_mode):
+    """Строка таблицы для одного участника."""
+    total_score = 0
+    total_penalty = 0
+    
+    # [FIX] Нормализация ключей: превращаем все ID задач в строки
+    # Это предотвращает ошибку TypeError при jsonify (смесь int и str)
+    # Словари задач копируются: строка - снимок, а не ссылка на живые данные
+    normalized_scores = {}
+    for k, v in p_data['scores'].items():
+        str_key = str(k)
+        # [FIX] Гарантируем, что все ключи в v тоже нормализованы
+        if isinstance(v, dict):
+            normalized_scores[str_key] = dict(v)
         else:
-            total_score = sum(s.get('score', 0) for s in normalized_scores.values())
-        
-        scoreboard.append({
-            'participant_id': p_id, 
-            'nickname': p_data['nickname'],
-            'organization': p_data.get('organization', None),
-            'scores': normalized_scores,
-            'total_score': total_score,
-            'total_penalty': total_penalty,
-            'solved_count': sum(1 for s in normalized_scores.values() if s.get('passed'))  # Add solved_count for ICPC display
-        })
+            normalized_scores[str_key] = {'score': 0, 'attempts': 0, 'passed': False, 'penalty': 0}
 
-    # [FIX] ИСПРАВЛЕНА СОРТИРОВКА ДЛЯ ICPC (по решенным задачам, потом по штрафу)
     if scoring_mode == 'icpc':
-        scoreboard.sort(key=lambda p: (-p['total_score'], p['total_penalty']))
+        # Fix: In ICPC mode, total_score should count solved problems (number of problems with passed=True)
+        total_score = sum(1 for s in normalized_scores.values() if s.get('passed'))
+        total_penalty = sum(s.get('penalty', 0) for s in normalized_scores.values() if s.get('passed'))
     else:
-        scoreboard.sort(key=lambda p: -p['total_score'])
-    
-    return scoreboard
+        total_score = sum(s.get('score', 0) for s in normalized_scores.values())
+    
+    return {
+        'participant_id': p_id, 
+        'nickname': p_data['nickname'],
+        'organization': p_data.get('organization', None),
+        'scores': normalized_scores,
+        'total_score': total_score,
+        'total_penalty': total_penalty,
+        'solved_count': sum(1 for s in normalized_scores.values() if s.get('passed'))  # Add solved_count for ICPC display
+    }
+
+def _mark_participant_changed(oly, participant_id):
+    """Отмечает участника для пересчета в индексе мест и сбрасывает кэш состояния."""
+    oly.setdefault('changed_participants', set()).add(participant_id)
+    oly['is_dirty'] = True
+
+def _sync_ranking_index(oly):
+    """
+    Приводит индекс мест в соответствие с участниками олимпиады.
+    Пересчитываются только отмеченные и новые участники.
+    """
+    scoring_mode = oly['config'].get('scoring', 'all_or_nothing')
+    participants = oly['participants']
+    index = oly.get('ranking_index')
+    changed = oly.pop('changed_participants', set())
+
+    if index is None or index.scoring_mode != scoring_mode:
+        index = oly['ranking_index'] = RankingIndex(scoring_mode)
+        changed = list(participants)
+    elif len(index) != len(participants):
+        # Участники, добавленные без отметки (например, при входе на страницу задач)
+        changed |= {p_id for p_id in participants if p_id not in index}
+        changed |= {p_id for p_id in index.rows if p_id not in participants}
+
+    for p_id in changed:
+        p_data = participants.get(p_id)
+        if p_data is None:
+            index.remove(p_id)
+        else:
+            index.update(p_id, _participant_row(p_id, p_data, scoring_mode))
+    return index
+
+def _compute_scoreboard(oly):
+    """Helper function to compute scoreboard from olympiad data (через инкрементальный индекс мест)."""
+    return _sync_ranking_index(oly).ordered_rows()
+
+def _get_masked_scoreboard(oly, live_scoreboard):
+    """
+    Маскированная таблица для зрителей во время заморозки.
+    Кэшируется, пока не сменится живая таблица (она пересобирается только при изменениях)
+    или снимок заморозки.
+    """
+    frozen_scoreboard = oly['frozen_scoreboard']
+    cached = oly.get('masked_scoreboard_cache')
+    if cached and cached[0] is live_scoreboard and cached[1] is frozen_scoreboard:
+        return cached[2]
+    masked = _apply_freeze_mask(frozen_scoreboard, live_scoreboard)
+    oly['masked_scoreboard_cache'] = (live_scoreboard, frozen_scoreboard, masked)
+    return masked
 
 def _apply_freeze_mask(frozen_scoreboard, live_scoreboard):
     """
@@ -473,9 +758,7 @@ def handle_join_room(data):
     
     if role == 'spectator':
         # Spectators see masked data
-        current_state = _get_olympiad_state(room, is_admin=False)
-        if current_state:
-            socketio.emit('full_status_update', current_state, to=request.sid)
+        _send_scoreboard_snapshot(room, VIEW_PUBLIC, request.sid)
         return
 
     if is_admin:
@@ -484,11 +767,9 @@ def handle_join_room(data):
         admin_room = _get_admin_room_name(room)
         join_room(admin_room)
         # Send unmasked data to admin
-        current_state = _get_olympiad_state(room, is_admin=True)
-        if current_state:
-            socketio.emit('full_status_update', current_state, to=request.sid)
+        _send_scoreboard_snapshot(room, VIEW_ADMIN, request.sid)
         return
-    with olympiad_lock:
+    with _get_olympiad_lock(room):
         if room not in olympiads:
             print(f"WARNING: Участник {nickname} пытается зайти в олимпиаду {room}, которой нет в памяти (возможно, сервер был перезагружен).")
             
@@ -541,30 +822,73 @@ def handle_join_room(data):
                                 'disqualified': False,
                                 'pending_submissions': 0
                             }
-                        oly['is_dirty'] = True
+                        _mark_participant_changed(oly, participant_id)
                     except Exception as e:
                         print(f"CRITICAL ERROR: Ошибка при добавлении участника {nickname}: {e}")
                         import traceback
                         traceback.print_exc()
                 else:
                     print(f"INFO: Участник {nickname} уже есть в памяти.")
+                # Прогресс проверки своих посылок участник получает только в личной комнате
+                join_room(_get_participant_room_name(room, participant_id))
             else:
                 print(f"WARNING: У {nickname} нет participant_id или не совпадает сессия. (SessID: {session_olympiad_id} != Room: {room})")
 
     # Send masked data for participant joining
-    current_state = _get_olympiad_state(room, is_admin=False)
-    if current_state:
-        socketio.emit('full_status_update', current_state, to=request.sid)
+    _send_scoreboard_snapshot(room, VIEW_PUBLIC, request.sid)
 
+@socketio.on('request_resync')
+def handle_request_resync(data):
+    """Клиент пропустил дельту - отправляем ему свежий снимок."""
+    room = data.get('room')
+    if not room:
+        return
+    view = data.get('view', VIEW_PUBLIC)
+    if view == VIEW_ADMIN and not session.get(f'is_organizer_for_{room}', False):
+        view = VIEW_PUBLIC
+    _send_scoreboard_snapshot(room, view, request.sid)
 
-def process_single_submission(item):
+
+def _track_pending_task(p_data, task_id, delta):
+    """
+    Посылки участника по задаче, ждущие вердикта (под блокировкой олимпиады).
+    Нужны для приоритета первой попытки: attempts растет только после вердикта.
+    """
+    pending = p_data.setdefault('pending_tasks', {})
+    count = max(0, pending.get(task_id, 0) + delta)
+    if count:
+        pending[task_id] = count
+    else:
+        pending.pop(task_id, None)
+    return count
+
+def _participant_save_row(p_data):
+    """
+    Копия строки участника для отложенной записи (вызывается под блокировкой олимпиады).
+    Код посылок сюда не входит - он пишется сразу при отправке (olympiad_task_code).
+    """
+    return {
+        'nickname': p_data.get('nickname'),
+        'organization': p_data.get('organization'),
+        'disqualified': p_data.get('disqualified', False),
+        'scores': {t_id: dict(s) for t_id, s in p_data.get('scores', {}).items()}
+    }
+
+def _persist_participant(olympiad_id, participant_id, p_data, dequeue_id=None):
+    """Ставит участника на отложенную запись в БД (под блокировкой олимпиады)."""
+    persistence.mark(olympiad_id, participant_id, _participant_save_row(p_data), dequeue_id=dequeue_id)
+
+def process_single_submission(item, remote=None):
     """
     Функция обработки ОДНОГО решения.
-    Запускается в отдельном грин-треде (greenlet) внутри пула.
+    Запускается в отдельном грин-треде (greenlet) внутри пула
+    или по запросу удаленного воркера (remote).
     """
     olympiad_id = item['olympiad_id']
     participant_id = item['participant_id']
     task_id = item['task_id']
+    # Запись в журнале очереди: удаляется вместе с сохранением результата
+    journal_id = item.get('journal_id')
     
     try:
         language = item['language']
@@ -573,33 +897,15 @@ def process_single_submission(item):
         
         print(f"WORKER [Thread]: Начало проверки для {participant_id}, задача {task_id}, язык {language}")
 
-        # 1. Получаем тесты из БД
-        tests = db.get_tests_for_task(task_id)
-        
-        # 2. Получаем чекер
-        task_info = db.get_task_details(task_id)
-        checker_code = None
-        if task_info:
-            try: 
-                checker_code = task_info['checker_code']
-            except (KeyError, TypeError):
-                # checker_code field may not exist in older tasks
-                pass
-
-        test_data_list = []
+        # 1. Тесты и чекер (из кэша в памяти, пока задача не менялась)
+        judge_data = db.get_judge_data(task_id)
+        checker_code = judge_data['checker_code']
+        test_data_list = judge_data['tests']
 
-        if not tests:
+        if not test_data_list:
             print(f"WORKER: Нет тестов для задачи {task_id}. Отмена проверки.")
             _handle_worker_error(olympiad_id, participant_id, task_id, "ОШИБКА: Для этой задачи не загружены тесты.")
             return 
-        else:
-            test_data_list = [
-                {
-                    'input': t['test_input'].replace('\r\n', '\n') if t['test_input'] else '',
-                    'output': t['expected_output'].replace('\r\n', '\n') if t['expected_output'] else '',
-                    'limit': t['time_limit']
-                } for t in tests
-            ]
 
         # === ВЫБОР ЯЗЫКА (Best Practice) ===
         RUNNERS = {
@@ -616,7 +922,25 @@ def process_single_submission(item):
             return
 
         # --- ЗАПУСК ---
-        verdicts, global_err = runner(code, test_data_list, checker_code=checker_code)
+        # В ICPC и all_or_nothing важен только факт "прошли все тесты", поэтому
+        # раннер останавливается на первом непройденном тесте и сразу освобождает песочницу
+        stop_on_failure = scoring_mode in ('icpc', 'all_or_nothing')
+        total_tests = len(test_data_list)
+
+        def report_progress(record):
+            # Живой прогресс для участника: только номер теста и вердикт, без вывода программы
+            socketio.emit('test_progress', {
+                'participant_id': participant_id,
+                'task_id': task_id,
+                'test_num': record.get('test_num'),
+                'verdict': record.get('verdict'),
+                'total': total_tests
+            }, to=_get_participant_room_name(olympiad_id, participant_id))
+
+        verdicts, global_err, from_cache = _run_with_verdict_cache(
+            runner, task_id, judge_data['version'], judge_data['verdict_cache'],
+            language, code, test_data_list, checker_code=checker_code, stop_on_failure=stop_on_failure,
+            remote=remote, test_set_id=judge_data['test_set_id'], on_progress=report_progress)
         
         results_details = []
         passed_count = 0
@@ -641,7 +965,7 @@ def process_single_submission(item):
         new_score_info = {}
         response_data = {}
 
-        with olympiad_lock:
+        with _get_olympiad_lock(olympiad_id):
             if olympiad_id in olympiads:
                 oly = olympiads[olympiad_id]
                 if participant_id in oly['participants']:
@@ -649,6 +973,7 @@ def process_single_submission(item):
                     
                     # Снимаем статус PENDING
                     p_data['pending_submissions'] = max(0, p_data.get('pending_submissions', 1) - 1)
+                    _track_pending_task(p_data, task_id, -1)
                     
                     # Инициализация, если задача новая
                     if task_id not in p_data['scores']:
@@ -711,7 +1036,7 @@ def process_single_submission(item):
                     # --- END LOGIKA ---
                     
                     new_score_info = task_submissions.copy()
-                    oly['is_dirty'] = True
+                    _mark_participant_changed(oly, participant_id)
                     
                     response_data = {
                         'task_id': task_id,
@@ -720,12 +1045,16 @@ def process_single_submission(item):
                         'new_score': new_score_info.get('score', 0),
                         'passed': new_score_info.get('passed', False),
                         'details': results_details,
-                        'verdict': "OK" if is_correct else ("CE" if global_err else "WA/RE")
+                        'verdict': "OK" if is_correct else ("CE" if global_err else "WA/RE"),
+                        'cached': from_cache
                     }
-                    try:
-                        db.save_olympiad_data(olympiad_id, oly)
-                    except Exception as e:
-                        print(f"DB SAVE ERROR: {e}")
+                    # В БД пишется только этот участник, фоновой пачкой (write_behind.py);
+                    # запись журнала удалится вместе с ним
+                    _persist_participant(olympiad_id, participant_id, p_data, dequeue_id=journal_id)
+                    journal_id = None
+
+        if not persistence.background:
+            persistence.flush()
 
         # === СОХРАНЕНИЕ ИСТОРИИ ===
         history_verdict = "Accepted" if is_correct else "Wrong Answer"
@@ -738,7 +1067,8 @@ def process_single_submission(item):
                     break
         
         try:
-            db.add_to_history(olympiad_id, participant_id, task_id, language, history_verdict, passed_count, len(test_data_list))
+            db.add_to_history(olympiad_id, participant_id, task_id, language, history_verdict, passed_count,
+                              len(test_data_list), journal_id=item.get('journal_id'))
         except Exception as e:
             print(f"HISTORY ERROR: {e}")
 
@@ -750,22 +1080,23 @@ def process_single_submission(item):
             'data': response_data
         }, to=olympiad_id)
 
-        # Send masked data to spectators and participants
-        spectator_state = _get_olympiad_state(olympiad_id, is_admin=False)
-        if spectator_state:
-            socketio.emit('full_status_update', spectator_state, to=olympiad_id)
-        
-        # Send unmasked data to admins
-        admin_state = _get_olympiad_state(olympiad_id, is_admin=True)
-        if admin_state:
-            admin_room = _get_admin_room_name(olympiad_id)
-            socketio.emit('full_status_update', admin_state, to=admin_room)
+        # Рассылка таблицы зрителям/участникам и организаторам (с объединением пачки вердиктов)
+        _schedule_broadcast(olympiad_id)
 
+    except WorkerLost as e:
+        # Удаленный воркер пропал - посылка возвращается в очередь, журнал не трогаем
+        print(f"WORKER: Воркер {e} потерян, посылка {participant_id}/{task_id} снова в очереди")
+        journal_id = None
+        submission_queue.put(item, lane=LANE_CONTEST)
     except Exception as e:
         print(f"CRITICAL WORKER ERROR in Thread: {e}")
         import traceback
         traceback.print_exc()
         _handle_worker_error(olympiad_id, participant_id, task_id, f"Server Error: {str(e)}")
+    finally:
+        # Посылка обработана (или отклонена) - в журнале она больше не нужна
+        if journal_id is not None:
+            db.dequeue_submission(journal_id)
 
 def submission_worker():
     """
@@ -776,20 +1107,114 @@ def submission_worker():
     print(f"INFO: Воркер проверки запущен. Параллельных потоков: {check_pool.size}")
     
     while True:
+        # Сначала ждем свободный слот, и только потом выбираем задание:
+        # так планировщик решает, кто следующий, в момент реального запуска
+        check_pool.wait_available()
         item = submission_queue.get() # Блокируется, если очередь пуста
         
-        # Передаем задачу в пул. spawn не блокирует выполнение,
-        # если есть свободные слоты в пуле. Если нет - ждет освобождения.
-        check_pool.spawn(process_single_submission, item)
+        if 'job' in item:
+            check_pool.spawn(_run_admin_job, item)
+        else:
+            check_pool.spawn(process_single_submission, item)
+
+def _run_admin_job(item):
+    """Выполняет админский запуск (/run_code) в пуле и отдает результат ожидающему запросу."""
+    try:
+        item['result'].set(item['job']())
+    except Exception as e:
+        item['result'].set_exception(e)
+
+def _run_in_admin_lane(fn):
+    """Ставит запуск в админскую полосу планировщика и ждет результат."""
+    result = AsyncResult()
+    submission_queue.put({'job': fn, 'result': result}, lane=LANE_ADMIN, owner='admin')
+    return result.get()
+
+# === УДАЛЕННЫЕ ВОРКЕРЫ ===
+# Воркер сам забирает посылки из общей очереди, когда у него есть свободный слот,
+# поэтому нагрузка делится между сервером и воркерами автоматически.
+
+def remote_worker_reaper():
+    """Фоновая задача: отключает воркеров без heartbeat и возвращает их посылки в очередь."""
+    while True:
+        gevent.sleep(max(1, remote_workers.timeout // 3))
+        remote_workers.reap()
+
+def _get_remote_worker():
+    """Проверяет токен и возвращает (worker, error_response)."""
+    if not remote_workers.check_token(request.headers.get('X-Worker-Token', '')):
+        return None, (jsonify({'error': 'Неверный токен воркера'}), 403)
+    data = request.get_json(silent=True) or {}
+    worker = remote_workers.get(data.get('worker_id', ''))
+    if not worker:
+        # Сервер перезапускался или воркер был отключен - пусть зарегистрируется заново
+        return None, (jsonify({'error': 'Воркер не зарегистрирован'}), 410)
+    return worker, None
+
+@app.route('/worker/api/register', methods=['POST'])
+def worker_register():
+    if not remote_workers.check_token(request.headers.get('X-Worker-Token', '')):
+        return jsonify({'error': 'Неверный токен воркера'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        slots = max(1, int(data.get('slots', 1)))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'slots должен быть числом'}), 400
+    worker = remote_workers.register(str(data.get('name') or request.remote_addr), slots, request.remote_addr)
+    return jsonify({'worker_id': worker.worker_id, 'heartbeat_interval': max(1, remote_workers.timeout // 3)})
+
+@app.route('/worker/api/heartbeat', methods=['POST'])
+def worker_heartbeat():
+    worker, error = _get_remote_worker()
+    if error:
+        return error
+    return jsonify({'status': 'ok', 'running': worker.running})
+
+@app.route('/worker/api/pull', methods=['POST'])
+def worker_pull():
+    """Long-poll: отдает воркеру следующее задание или пустой ответ по таймауту."""
+    worker, error = _get_remote_worker()
+    if error:
+        return error
+
+    deadline = time.time() + WORKER_POLL_SECONDS
+    while time.time() < deadline:
+        job = remote_workers.next_job(worker, timeout=0)
+        if job:
+            return jsonify({'job': job})
+
+        item = submission_queue.get(timeout=1, contest_only=True)
+        worker.last_seen = time.time()
+        if item is None:
+            continue
+        # Подготовка (тесты, кэш вердиктов, подсчет баллов) идет на сервере,
+        # воркеру уходит только запуск в Docker
+        gevent.spawn(process_single_submission, item, worker)
+        job = remote_workers.next_job(worker, timeout=5)
+        if job:
+            return jsonify({'job': job})
+    return jsonify({'job': None})
+
+@app.route('/worker/api/result', methods=['POST'])
+def worker_result():
+    worker, error = _get_remote_worker()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    if not remote_workers.complete(worker, data.get('job_id'), data.get('verdicts') or [], data.get('global_err')):
+        return jsonify({'error': 'Задание не найдено'}), 404
+    return jsonify({'status': 'ok'})
+
 
 def _handle_worker_error(olympiad_id, participant_id, task_id, error_msg):
     """Вспомогательная функция, чтобы убрать статус 'В очереди' при ошибках"""
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             p_data = olympiads[olympiad_id]['participants'].get(participant_id)
             if p_data:
                 # Уменьшаем счетчик, чтобы разблокировать интерфейс
                 p_data['pending_submissions'] = max(0, p_data.get('pending_submissions', 1) - 1)
+                _track_pending_task(p_data, task_id, -1)
     
     # Отправляем сообщение об ошибке клиенту
     socketio.emit('personal_result', {
@@ -830,7 +1255,7 @@ def spectate_olympiad(olympiad_id):
     Публичный доступ к таблице результатов.
     Закрывается, если олимпиада завершена.
     """
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads:
              return render_template('error.html', message="Олимпиада не найдена"), 404
         
@@ -855,7 +1280,28 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@app.route('/admin/api/workers')
+@admin_required
+def admin_workers_status():
+    """Загрузка локального пула, очереди, удаленных воркеров и пула соединений БД."""
+    return jsonify({
+        'local_slots': check_pool.size,
+        'local_running': len(check_pool),
+        'queue': submission_queue.lane_sizes(),
+        'workers': remote_workers.snapshot(),
+        'db_pool': db.pool.stats()
+    })
+
 
+@app.route('/admin/api/olympiad/<olympiad_id>/code_history/<participant_id>')
+@admin_required
+def admin_code_history(olympiad_id, participant_id):
+    """Все отправленные решения участника (task_id - только по одной задаче)."""
+    task_id = request.args.get('task_id', type=int)
+    history = db.get_code_history(olympiad_id, participant_id, task_id)
+    for item in history:
+        item['time'] = time.strftime("%d.%m %H:%M:%S", time.localtime(item['submitted_at']))
+    return jsonify(history)
 
 @admin_required
 @app.route('/run_code', methods=['POST'])
@@ -872,35 +1318,17 @@ def run_code_submission():
     if not code:
         return jsonify({'error': 'Код пустой'}), 400
 
-    # 1. Получаем тесты
-    tests = db.get_tests_for_task(task_id)
-    
-    # 2. Получаем чекер
-    task_info = db.get_task_details(task_id)
-    checker_code = None
-    if task_info:
-        try: 
-            checker_code = task_info['checker_code']
-        except (KeyError, TypeError):
-            # checker_code field may not exist in older tasks
-            pass
+    # 1. Тесты и чекер (из кэша в памяти, пока задача не менялась)
+    judge_data = db.get_judge_data(task_id)
+    checker_code = judge_data['checker_code']
+    test_data_list = judge_data['tests']
 
-    test_data_list = []
-
-    if not tests:
+    if not test_data_list:
         if checker_code and checker_code.strip():
             # Запуск для проверки работоспособности (без тестов)
-            test_data_list.append({'input': '', 'output': '', 'limit': 2.0})
+            test_data_list = [{'input': '', 'output': '', 'limit': 2.0}]
         else:
             return jsonify({'error': 'Нет тестов для этой задачи и нет чекера'}), 400
-    else:
-        test_data_list = [
-            {
-                'input': t['test_input'].replace('\r\n', '\n') if t['test_input'] else '',
-                'output': t['expected_output'].replace('\r\n', '\n') if t['expected_output'] else '',
-                'limit': t['time_limit']
-            } for t in tests
-        ]
     
     # === ВЫБОР ЯЗЫКА ===
     RUNNERS = {
@@ -913,12 +1341,11 @@ def run_code_submission():
     if not runner:
         return jsonify({'error': f'Язык {language} не поддерживается сервером'}), 400
     
-    # === ЗАЩИТА: ИСПОЛЬЗУЕМ СЕМАФОР ===
-    verdicts = []
-    global_err = None
-    
-    with docker_check_semaphore:
-        verdicts, global_err = runner(code, test_data_list, checker_code=checker_code)
+    # === ЗАЩИТА: ЗАПУСК ЧЕРЕЗ АДМИНСКУЮ ПОЛОСУ ОЧЕРЕДИ (при попадании в кэш песочница не нужна) ===
+    verdicts, global_err, from_cache = _run_with_verdict_cache(
+        runner, task_id, judge_data['version'], judge_data['verdict_cache'],
+        language, code, test_data_list, checker_code=checker_code, schedule=_run_in_admin_lane,
+        test_set_id=judge_data['test_set_id'] if test_data_list is judge_data['tests'] else None)
     # ==================================
     
     results = []
@@ -936,13 +1363,14 @@ def run_code_submission():
             'passed': False
         })
     else:
+        tests = judge_data['tests']
         for i, v in enumerate(verdicts):
             verdict = v.get('verdict', 'Internal Error')
             passed = (verdict == "Accepted")
             if passed: passed_count += 1
             
-            inp = tests[i]['test_input'] if i < len(tests) else ""
-            exp = tests[i]['expected_output'] if i < len(tests) else "(checker)"
+            inp = tests[i]['input'] if i < len(tests) else ""
+            exp = tests[i]['output'] if i < len(tests) else "(checker)"
                 
             results.append({
                 'test_num': i + 1,
@@ -957,7 +1385,8 @@ def run_code_submission():
     overall_result = {
         'passed_count': passed_count,
         'total_tests': len(test_data_list),
-        'details': results
+        'details': results,
+        'cached': from_cache
     }
     
     return jsonify(overall_result)
@@ -965,7 +1394,6 @@ def run_code_submission():
 @app.route('/olympiad/submit/<olympiad_id>', methods=['POST'])
 def olympiad_submit(olympiad_id):
     participant_id = session.get('participant_id')
-    nickname = session.get('nickname')
     
     # BUG FIX: Validate JSON data exists and has required fields
     try:
@@ -996,7 +1424,7 @@ def olympiad_submit(olympiad_id):
     except Exception as e:
         return jsonify({'error': f'Ошибка обработки запроса: {str(e)}'}), 400
     
-    with olympiad_lock: 
+    with _get_olympiad_lock(olympiad_id): 
         if olympiad_id not in olympiads or not participant_id:
             return jsonify({'error': 'Олимпиада не активна или вы не авторизованы.'}), 403
 
@@ -1021,6 +1449,11 @@ def olympiad_submit(olympiad_id):
         task_score = scores.get(task_id) or scores.get(str(task_id))
         if task_score and task_score.get('passed', False):
             return jsonify({'error': 'Эта задача уже решена. Нельзя отправлять дополнительные решения.'}), 400
+        # Первая попытка по задаче получает приоритет в очереди. Попытки считаются после
+        # вердикта, поэтому посылки, еще ждущие проверки, тоже учитываются: пачка посылок
+        # до первого вердикта не займет весь первый уровень
+        first_attempt = ((not task_score or task_score.get('attempts', 0) == 0)
+                         and not p_data.get('pending_tasks', {}).get(task_id))
         
         # BUG FIX: Validate start_time exists before using it
         if oly.get('start_time') and oly['start_time'] is not None:
@@ -1033,21 +1466,29 @@ def olympiad_submit(olympiad_id):
 
         p_data['last_submissions'][task_id] = code 
         p_data['pending_submissions'] = p_data.get('pending_submissions', 0) + 1
+        _track_pending_task(p_data, task_id, +1)
         
         scoring_mode = oly['config'].get('scoring', 'all_or_nothing')
 
-    db.update_submission_immediate(olympiad_id, participant_id, nickname, task_id, code)
-
     task_item = {
         'olympiad_id': olympiad_id,
         'participant_id': participant_id,
         'task_id': task_id,
         'language': language,
         'code': code,
-        'scoring_mode': scoring_mode
+        'scoring_mode': scoring_mode,
+        'first_attempt': first_attempt
     }
+
+    # Код (строка задачи + история попыток) и запись журнала очереди сохраняются одним коммитом -
+    # посылка переживет перезапуск
+    journal_id = db.update_submission_immediate(olympiad_id, participant_id, task_id, code, language=language, queue_item=task_item)
+    if journal_id is not None:
+        task_item['journal_id'] = journal_id
+    else:
+        print(f"WARNING: Посылка {participant_id}/{task_id} не записана в журнал и не переживет перезапуск")
     
-    submission_queue.put(task_item)
+    submission_queue.put(task_item, lane=LANE_CONTEST)
     
     socketio.emit('submission_pending', {
         'participant_id': participant_id,
@@ -1178,7 +1619,7 @@ def olympiad_create():
 def get_olympiad_mode(olympiad_id):
     """API: Возвращает режим олимпиады (free/closed) для UI."""
 
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads:
             return jsonify({'error': 'not found'}), 404
         
@@ -1200,7 +1641,7 @@ def olympiad_join():
         
         oly_data_copy = None 
 
-        with olympiad_lock:
+        with _get_olympiad_lock(olympiad_id):
             if olympiad_id not in olympiads:
                 flash('Олимпиада с таким ID не найдена.', 'danger')
                 return redirect(url_for('olympiad_join'))
@@ -1305,7 +1746,7 @@ def olympiad_host(olympiad_id):
     oly_mode = 'free'
     tasks_details = []
     
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads:
             return "Олимпиада не найдена", 404
         
@@ -1334,7 +1775,7 @@ def olympiad_host(olympiad_id):
 @admin_required
 def olympiad_start(olympiad_id):
 
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             current_time = time.time()
             # 1. Обновляем в оперативной памяти (для мгновенной работы)
@@ -1343,6 +1784,7 @@ def olympiad_start(olympiad_id):
             
             # 2. Сохраняем в БД (на случай перезагрузки)
             db.set_olympiad_start_time(olympiad_id, current_time)
+            _prewarm_judge_data(olympiads[olympiad_id]['task_ids'])
           
             socketio.emit('olympiad_started', {'status': 'ok'}, to=olympiad_id)
             
@@ -1353,7 +1795,7 @@ def olympiad_start(olympiad_id):
 def olympiad_run(olympiad_id):
     
     oly_data_copy = None
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         
         if session.get('olympiad_id') != olympiad_id:
             
@@ -1364,7 +1806,7 @@ def olympiad_run(olympiad_id):
             session.pop('organization', None)
             return redirect(url_for('olympiad_join'))
     
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads or 'nickname' not in session:
             return redirect(url_for('olympiad_join'))
         
@@ -1403,6 +1845,7 @@ def olympiad_run(olympiad_id):
                 'disqualified': False, 
                 'pending_submissions': 0  
             }
+            _persist_participant(olympiad_id, participant_id, oly['participants'][participant_id])
 
         
         oly_data_copy = oly.copy()
@@ -1415,7 +1858,7 @@ def olympiad_run(olympiad_id):
 @app.route('/olympiad/finish_early/<olympiad_id>', methods=['POST'])
 def olympiad_finish_early(olympiad_id):
 
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads or 'participant_id' not in session:
             return redirect(url_for('olympiad_join'))
         
@@ -1427,16 +1870,8 @@ def olympiad_finish_early(olympiad_id):
             oly['is_dirty'] = True
             flash('Вы успешно завершили олимпиаду.', 'success')
     
-    # Send masked data to spectators and participants
-    spectator_state = _get_olympiad_state(olympiad_id, is_admin=False)
-    if spectator_state:
-        socketio.emit('full_status_update', spectator_state, to=olympiad_id)
-    
-    # Send unmasked data to admins
-    admin_state = _get_olympiad_state(olympiad_id, is_admin=True)
-    if admin_state:
-        admin_room = _get_admin_room_name(olympiad_id)
-        socketio.emit('full_status_update', admin_state, to=admin_room)
+    # Рассылка таблицы зрителям/участникам и организаторам (с объединением пачки вердиктов)
+    _schedule_broadcast(olympiad_id)
 
     
     return redirect(url_for('olympiad_end', olympiad_id=olympiad_id))
@@ -1446,7 +1881,7 @@ def olympiad_end(olympiad_id):
     
     results_copy = None
     
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             results_copy = olympiads[olympiad_id].copy()
 
@@ -1551,7 +1986,7 @@ def olympiad_disqualify(olympiad_id, participant_id):
     """ОРГАНИЗАТОР: Дисквалифицирует участника."""
     
     nickname = "???"
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id not in olympiads:
             return "Олимпиада не найдена", 404
             
@@ -1560,27 +1995,20 @@ def olympiad_disqualify(olympiad_id, participant_id):
         if participant_id in oly['participants']:
             p_data = oly['participants'][participant_id]
             p_data['disqualified'] = True 
-            oly['is_dirty'] = True
+            _mark_participant_changed(oly, participant_id)
             p_data['finished_early'] = True 
             nickname = p_data['nickname']
             
             for task_id in p_data['scores']:
                  p_data['scores'][task_id]['score'] = 0 
+            _persist_participant(olympiad_id, participant_id, p_data)
                 
             flash(f"Участник {nickname} был дисквалифицирован. Все баллы обнулены.", 'warning')
         else:
             flash('Участник не найден.', 'danger')
 
-    # Send masked data to spectators and participants
-    spectator_state = _get_olympiad_state(olympiad_id, is_admin=False)
-    if spectator_state:
-        socketio.emit('full_status_update', spectator_state, to=olympiad_id)
-    
-    # Send unmasked data to admins
-    admin_state = _get_olympiad_state(olympiad_id, is_admin=True)
-    if admin_state:
-        admin_room = _get_admin_room_name(olympiad_id)
-        socketio.emit('full_status_update', admin_state, to=admin_room)
+    # Рассылка таблицы зрителям/участникам и организаторам (с объединением пачки вердиктов)
+    _schedule_broadcast(olympiad_id)
     
         
     return redirect(url_for('olympiad_host', olympiad_id=olympiad_id))
@@ -1594,7 +2022,7 @@ def olympiad_finish_by_host(olympiad_id):
     final_scoreboard = None
     freeze_time = None
     
-    with olympiad_lock:
+    with olympiad_lock, _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             olympiads[olympiad_id]['status'] = 'finished' 
             oly_data_to_save = olympiads[olympiad_id].copy()
@@ -1639,10 +2067,17 @@ def olympiad_finish_by_host(olympiad_id):
             
             session.pop(f'is_organizer_for_{olympiad_id}', None)
             del olympiads[olympiad_id] 
+            olympiad_locks.pop(olympiad_id, None)
+            _drop_scoreboard_streams(olympiad_id)
+            with payloads_lock:
+                for view in (VIEW_PUBLIC, VIEW_ADMIN):
+                    scoreboard_payloads.pop((olympiad_id, view), None)
 
     socketio.emit('olympiad_finished', {'status': 'finished'}, to=olympiad_id)
     
     if oly_data_to_save:
+        # Сначала отложенные записи, затем полная финальная - она новее любой из них
+        persistence.flush()
         db.save_olympiad_data(olympiad_id, oly_data_to_save)
         
         # Save frozen data for reveal ceremony if applicable
@@ -1880,6 +2315,7 @@ def add_task():
         topic = request.form['topic']
         description = request.form['description']
         checker_code = request.form.get('checker_code', '') # Читаем чекер
+        verdict_cache_enabled = 'verdict_cache' in request.form
 
         # Обработка файла (PDF и т.д.)
         file = request.files['attachment']
@@ -1890,7 +2326,7 @@ def add_task():
             file_format = file.filename.split('.')[-1].lower()
 
         # Передаем checker_code в БД
-        db.add_task(title, difficulty, topic, description, attachment_data, file_format, checker_code)
+        db.add_task(title, difficulty, topic, description, attachment_data, file_format, checker_code, verdict_cache_enabled)
         
         flash('Задача успешно добавлена!', 'success')
         return redirect(url_for('tasks_list'))
@@ -1911,6 +2347,7 @@ def edit_task(task_id):
         topic = request.form['topic']
         description = request.form['description']
         checker_code = request.form.get('checker_code', '') # Читаем чекер
+        verdict_cache_enabled = 'verdict_cache' in request.form
 
         file = request.files['attachment']
         attachment_data = None
@@ -1921,7 +2358,7 @@ def edit_task(task_id):
             file_format = file.filename.split('.')[-1].lower()
 
         # Обновляем (логика обновления в db_manager должна поддерживать checker_code)
-        db.update_task(task_id, title, difficulty, topic, description, attachment_data, file_format, checker_code)
+        db.update_task(task_id, title, difficulty, topic, description, attachment_data, file_format, checker_code, verdict_cache_enabled)
         
         flash('Задача обновлена!', 'success')
         return redirect(url_for('tasks_list'))
@@ -2152,7 +2589,7 @@ def api_get_history(olympiad_id):
 
     tasks_order = []
     
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             tasks_order = olympiads[olympiad_id]['task_ids']
     
@@ -2186,12 +2623,59 @@ def api_get_history(olympiad_id):
         
     return jsonify(history_json)
 
+# Готовые JSON-ответы таблицы: (olympiad_id, view) -> ключ версии, тело, gzip, ETag.
+# Пересобираются только при смене версии состояния, а не на каждый запрос.
+scoreboard_payloads = {}
+payloads_lock = Lock()
+
+def _get_scoreboard_payload(olympiad_id, view):
+    oly = olympiads.get(olympiad_id)
+    if oly is None:
+        return None
+    state = _get_olympiad_state(olympiad_id, is_admin=(view == VIEW_ADMIN))
+    if not state:
+        return None
+    # Версия растет только при пересборке cached_state внутри _get_olympiad_state,
+    # поэтому прочитанная сразу после нее соответствует полученному состоянию
+    version = oly.get('state_version', 0)
+    key = (version, state['status'], state['is_frozen'], oly.get('freeze_triggered', False))
+
+    with payloads_lock:
+        payload = scoreboard_payloads.get((olympiad_id, view))
+        if payload and payload['key'] == key:
+            return payload
+
+    # remaining_seconds меняется каждую секунду - в кэшируемый ответ не входит
+    state.pop('remaining_seconds', None)
+    body = json.dumps(state, ensure_ascii=False).encode('utf-8')
+    payload = {
+        'key': key,
+        'body': body,
+        'gzip': gzip.compress(body, 5),
+        'etag': hashlib.md5(body).hexdigest()
+    }
+    with payloads_lock:
+        scoreboard_payloads[(olympiad_id, view)] = payload
+    return payload
+
 @app.route('/olympiad/api/scoreboard/<olympiad_id>')
 def api_get_scoreboard(olympiad_id):
-    state = _get_olympiad_state(olympiad_id)
-    if not state:
+    payload = _get_scoreboard_payload(olympiad_id, VIEW_PUBLIC)
+    if not payload:
         return jsonify({'error': 'Not found'}), 404
-    return jsonify(state)
+
+    # Слабый ETag: gzip и несжатое тело - одно и то же представление, побайтово разное.
+    # If-None-Match сравнивается слабо (RFC 7232), поэтому 304 подходит для обоих
+    if request.if_none_match.contains_weak(payload['etag']):
+        response = Response(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(payload['gzip'], mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(payload['body'], mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(payload['etag'], weak=True)
+    return response
 
 
 def restore_state_on_startup():
@@ -2208,6 +2692,7 @@ def restore_state_on_startup():
                     duration_sec = data['config']['duration_minutes'] * 60
                     if (current_time - data['start_time']) > (duration_sec + 3600):
                         continue
+                    _prewarm_judge_data(data.get('task_ids', []))
                 olympiads[oid] = data
 
             # 2. Загружаем запланированные
@@ -2239,6 +2724,30 @@ def restore_state_on_startup():
                 }
                 print(f"INFO: Загружена запланированная олимпиада {oid} на {row['start_time']}")
 
+            # 3. Возвращаем в очередь посылки, которые не успели проверить до остановки
+            requeued = 0
+            for row in db.get_queued_submissions():
+                oly = olympiads.get(row['olympiad_id'])
+                p_data = oly['participants'].get(row['participant_uuid']) if oly else None
+                if not p_data:
+                    db.dequeue_submission(row['id'])
+                    continue
+                p_data['pending_submissions'] = p_data.get('pending_submissions', 0) + 1
+                _track_pending_task(p_data, row['task_id'], +1)
+                submission_queue.put({
+                    'olympiad_id': row['olympiad_id'],
+                    'participant_id': row['participant_uuid'],
+                    'task_id': row['task_id'],
+                    'language': row['language'],
+                    'code': row['code'],
+                    'scoring_mode': row['scoring_mode'],
+                    'first_attempt': bool(row['first_attempt']),
+                    'journal_id': row['id']
+                }, lane=LANE_CONTEST)
+                requeued += 1
+            if requeued:
+                print(f"INFO: Возвращено в очередь непроверенных посылок: {requeued}")
+
         print(f"SUCCESS: Состояние восстановлено.")
     except Exception as e:
         print(f"ERROR: Ошибка восстановления состояния: {e}")
@@ -2253,7 +2762,7 @@ def olympiad_edit_time(olympiad_id):
     if not new_time_str:
         return redirect(url_for('olympiad_join'))
     
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             try:
                 dt = datetime.strptime(new_time_str, "%Y-%m-%dT%H:%M")
@@ -2281,7 +2790,7 @@ def olympiad_print_cards(olympiad_id):
     
     # Получаем название олимпиады
     oly_name = olympiad_id
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             oly_name = olympiads[olympiad_id].get('name', olympiad_id)
 
@@ -2528,7 +3037,7 @@ def olympiad_presentation(olympiad_id):
     
     # Get olympiad name
     oly_name = olympiad_id
-    with olympiad_lock:
+    with _get_olympiad_lock(olympiad_id):
         if olympiad_id in olympiads:
             oly_name = olympiads[olympiad_id].get('name', olympiad_id)
     
@@ -0,0 +1,78 @@
+"""
+Бенчмарк сравнения вывода: прежний compare_outputs (split() обоих текстов)
+против потокового побайтового из judge_scripts/judge_utils.py.
+
+Для ответа из N токенов (по умолчанию 1 000 000) замеряет время и пиковую
+память (tracemalloc) в типичных случаях: совпадение, совпадение с другими
+пробелами, ошибка в первом и в последнем токене:
+    python bench_compare_outputs.py --tokens 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'judge_scripts'))
+from judge_utils import compare_outputs  # noqa: E402
+
+
+def old_compare_outputs(user_output, expected_output):
+    # Прежняя реализация: полные списки токенов обоих текстов
+    def get_tokens(text):
+        if not text:
+            return []
+        return text.strip().split()
+    return get_tokens(user_output) == get_tokens(expected_output)
+
+
+def make_cases(tokens):
+    values = [str(i * 7919 % 1000003) for i in range(tokens)]
+    expected = " ".join(values) + "\n"
+    wrong_first = "x" + expected[1:]
+    wrong_last = expected[:-2] + "x\n"
+    return {
+        'совпадение': (expected, expected),
+        'другие пробелы': ("\n".join(values) + "\n", expected),
+        'ошибка в 1-м токене': (wrong_first, expected),
+        'ошибка в последнем': (wrong_last, expected),
+    }
+
+
+def measure(compare, user, expected, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compare(user, expected)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    compare(user, expected)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк compare_outputs")
+    parser.add_argument('--tokens', type=int, default=1000000, help="токенов в ответе")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = make_cases(args.tokens)
+    print(f"Ответ: {args.tokens} токенов, {len(cases['совпадение'][1]) / (1024 * 1024):.1f} МБ")
+    print(f"\n{'Случай':<22}{'split, мс':>11}{'split, МБ':>11}{'поток, мс':>11}{'поток, МБ':>11}{'ускорение':>11}")
+    for name, (user, expected) in cases.items():
+        assert old_compare_outputs(user, expected) == compare_outputs(user, expected)
+        old_ms, old_mb = measure(old_compare_outputs, user, expected, args.repeat)
+        new_ms, new_mb = measure(compare_outputs, user, expected, args.repeat)
+        speedup = old_ms / new_ms if new_ms > 0 else float('inf')
+        print(f"{name:<22}{old_ms:>11.1f}{old_mb:>11.1f}{new_ms:>11.1f}{new_mb:>11.1f}{speedup:>10.1f}x")
+
+    # В раннере вывод программы приходит байтами - перекодировать в str не нужно
+    user, expected = cases['другие пробелы']
+    new_ms, new_mb = measure(compare_outputs, user.encode(), expected.encode(), args.repeat)
+    print(f"{'другие пробелы, bytes':<22}{'':>11}{'':>11}{new_ms:>11.1f}{new_mb:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Бенчмарк запросов к БД до и после индексов из SCHEMA_MIGRATIONS.
+
+Создает временную базу с синтетической историей посылок (по умолчанию
+1 000 000 строк olympiad_history) и набором тестов, замеряет горячие
+запросы без индексов, затем создает индексы из миграций и замеряет снова:
+    python bench_db_indexes.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from db_manager import DBManager, SCHEMA_MIGRATIONS
+
+VERDICTS = ['Accepted', 'Wrong Answer', 'Time Limit Exceeded', 'Runtime Error', 'Compilation Error']
+
+
+def fill(db, rows, olympiads, participants, tasks, test_tasks, tests_per_task):
+    rnd = random.Random(42)
+    start = time.time() - 30 * 24 * 3600
+    with db._get_conn() as conn:
+        batch = []
+        for i in range(rows):
+            batch.append((f"oly{rnd.randrange(olympiads):04d}", f"p{rnd.randrange(participants):04d}",
+                          rnd.randrange(1, tasks + 1), 'Python', rnd.choice(VERDICTS),
+                          rnd.randrange(20), 20, start + i * 2.5))
+            if len(batch) >= 50000:
+                conn.executemany("""
+                    INSERT INTO olympiad_history (olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, batch)
+                batch = []
+        if batch:
+            conn.executemany("""
+                INSERT INTO olympiad_history (olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+        conn.executemany("INSERT INTO tests (task_id, test_input, expected_output, time_limit) VALUES (?, ?, ?, ?)",
+                         [(t, "1 2\n", "3", 1.0) for t in range(1, test_tasks + 1) for _ in range(tests_per_task)])
+        conn.commit()
+
+
+def _index_statements():
+    # Только индексы из миграций: остальные миграции (ALTER TABLE) повторно не применяются
+    return [(m.group(1), sql) for _, _, statements in SCHEMA_MIGRATIONS for sql in statements
+            for m in [re.search(r"CREATE INDEX IF NOT EXISTS (\w+)", sql)] if m]
+
+
+def drop_indexes(db):
+    with db._get_conn() as conn:
+        for name, _ in _index_statements():
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+
+
+def create_indexes(db):
+    with db._get_conn() as conn:
+        for _, sql in _index_statements():
+            conn.execute(sql)
+        conn.commit()
+
+
+def run_queries(db, repeat, olympiads, participants, test_tasks):
+    rnd = random.Random(7)
+    freeze_time = time.time() - 15 * 24 * 3600
+    queries = {
+        'get_first_solvers': lambda: db.get_first_solvers(f"oly{rnd.randrange(olympiads):04d}"),
+        'get_participant_history': lambda: db.get_participant_history(
+            f"oly{rnd.randrange(olympiads):04d}", f"p{rnd.randrange(participants):04d}"),
+        'history before freeze': lambda: _history_before(db, f"oly{rnd.randrange(olympiads):04d}", freeze_time),
+        'get_submissions_during_freeze': lambda: db.get_submissions_during_freeze(
+            f"oly{rnd.randrange(olympiads):04d}", time.time() - 3600),
+        'start time (MIN timestamp)': lambda: _min_timestamp(db, f"oly{rnd.randrange(olympiads):04d}"),
+        'get_tests_for_task': lambda: db.get_tests_for_task(rnd.randrange(1, test_tasks + 1)),
+    }
+    results = {}
+    for name, query in queries.items():
+        query()  # прогрев кэша страниц
+        started = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+    return results
+
+
+def _history_before(db, olympiad_id, freeze_time):
+    # Тот же запрос, что в app._compute_scoreboard_at_time
+    with db._get_conn() as conn:
+        return conn.execute("""
+            SELECT participant_id, task_id, verdict, timestamp, tests_passed, total_tests
+            FROM olympiad_history
+            WHERE olympiad_id = ? AND timestamp < ?
+            ORDER BY timestamp ASC
+        """, (olympiad_id, freeze_time)).fetchall()
+
+
+def _min_timestamp(db, olympiad_id):
+    # Тот же запрос, что в get_all_active_olympiads_data
+    with db._get_conn() as conn:
+        return conn.execute("SELECT MIN(timestamp) FROM olympiad_history WHERE olympiad_id=?", (olympiad_id,)).fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк индексов БД Synaqmaker")
+    parser.add_argument('--rows', type=int, default=1000000, help="строк в olympiad_history")
+    parser.add_argument('--olympiads', type=int, default=200)
+    parser.add_argument('--participants', type=int, default=100)
+    parser.add_argument('--tasks', type=int, default=10)
+    parser.add_argument('--test-tasks', type=int, default=2000, help="задач с тестами")
+    parser.add_argument('--tests-per-task', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_")
+    try:
+        db = DBManager(os.path.join(tmp_dir, "bench.db"))
+        drop_indexes(db)
+
+        started = time.time()
+        fill(db, args.rows, args.olympiads, args.participants, args.tasks, args.test_tasks, args.tests_per_task)
+        print(f"Заполнено: {args.rows} строк истории, {args.test_tasks * args.tests_per_task} тестов "
+              f"за {time.time() - started:.1f} с")
+
+        before = run_queries(db, args.repeat, args.olympiads, args.participants, args.test_tasks)
+
+        started = time.time()
+        create_indexes(db)
+        print(f"Индексы созданы за {time.time() - started:.1f} с, версия схемы {db.get_schema_version()}")
+
+        after = run_queries(db, args.repeat, args.olympiads, args.participants, args.test_tasks)
+
+        print(f"\n{'Запрос':<32}{'без индексов, мс':>18}{'с индексами, мс':>18}{'ускорение':>12}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] > 0 else float('inf')
+            print(f"{name:<32}{before[name]:>18.2f}{after[name]:>18.2f}{speedup:>11.0f}x")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
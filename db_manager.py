@@ -7,7 +7,11 @@ import json
 import platform
 import shutil 
 import time
-from threading import RLock
+import hashlib
+import base64
+import zlib
+from threading import RLock, Thread, Condition, Event, Timer, local
+from collections import OrderedDict
 
 # НАСТРОЙКИ DOCKER
 DOCKER_IMAGE_PYTHON = "testirovschik-python"
@@ -34,6 +38,45 @@ DOCKER_COMMON_ARGS = [
     "-w", "/home/appuser/run" 
 ]
 
+# Пул "тёплых" контейнеров: вместо холодного `docker run --rm` на каждое решение
+# держим заранее запущенные песочницы (с теми же DOCKER_COMMON_ARGS) и выполняем
+# судью через `docker exec`. Между проверками контейнер сбрасывается.
+POOL_LABEL = "synaqmaker.pool=1"
+# Папки-слоты контейнеров пула лежат рядом с test_data (та же ФС),
+# чтобы набор тестов можно было подложить в слот жесткими ссылками
+POOL_SLOTS_DIR = os.path.join(BASE_DIR, 'judge_slots')
+SLOT_TESTS_DIR = "tests"
+POOL_MAX_JOBS_PER_CONTAINER = 200  # После N проверок контейнер пересоздается
+# Сброс между проверками: процессы пользователя и все, что он мог оставить
+# в записываемых tmpfs (/dev/shm и /dev/mqueue живут и при --read-only).
+# Три шаблона покрывают обычные и скрытые имена (включая "..x").
+# Если после чистки что-то осталось - код возврата 1, контейнер пересоздается
+POOL_SCRATCH_DIRS = "/tmp /dev/shm /dev/mqueue"
+POOL_RESET_COMMAND = [
+    "sh", "-c",
+    "kill -9 -1 2>/dev/null; "
+    f"for d in {POOL_SCRATCH_DIRS}; do rm -rf \"$d\"/* \"$d\"/.[!.]* \"$d\"/..?* 2>/dev/null; done; "
+    f"[ -z \"$(find {POOL_SCRATCH_DIRS} -mindepth 1 2>/dev/null | head -n 1)\" ]"
+]
+
+# Кэш компиляции (C++/C#): бинарники и ошибки компиляции по хэшу исходника,
+# версии компилятора (ID Docker-образа) и флагов (текст раннера)
+COMPILE_CACHE_DIR = os.path.join(BASE_DIR, 'compile_cache')
+COMPILED_LANGUAGES = {"C++", "C#"}
+CACHED_ARTIFACT_FILENAME = "cached_artifact.bin"
+
+# Лимит stdout программы участника на один тест (дальше - Output Limit Exceeded)
+OUTPUT_LIMIT_BYTES = 64 * 1024 * 1024
+
+# Лимит памяти на один тест: раннер ставит его каждому запуску программы (ulimit -d)
+MEMORY_LIMIT_MB = 512
+# Запас памяти контейнера сверх лимита теста: раннер, timeout, компилятор
+CONTAINER_MEMORY_OVERHEAD_MB = 128
+
+def set_output_limit(max_mb):
+    global OUTPUT_LIMIT_BYTES
+    OUTPUT_LIMIT_BYTES = max(1, int(max_mb)) * 1024 * 1024
+
 def load_judge_script(filename):
     path = os.path.join(SCRIPTS_DIR, filename)
     try:
@@ -49,12 +92,654 @@ def _get_docker_path(abs_path):
             abs_path = "/" + abs_path[0].lower() + abs_path[2:]
     return abs_path
 
+def _clear_dir(path):
+    """Удаляет содержимое папки, не трогая саму папку (она смонтирована в контейнер)."""
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isdir(full) and not os.path.islink(full):
+            shutil.rmtree(full, ignore_errors=True)
+        else:
+            try: os.remove(full)
+            except OSError: pass
+
+class _PooledContainer:
+    """Один запущенный контейнер-песочница и его рабочая папка на хосте."""
+    def __init__(self, image, container_id, slot_dir):
+        self.image = image
+        self.container_id = container_id
+        self.slot_dir = slot_dir
+        self.jobs_done = 0
+
+class ContainerPool:
+    """
+    Пул заранее запущенных контейнеров для каждого образа.
+    Каждый контейнер монтирует свою папку-слот (read-only внутри контейнера),
+    хост пишет туда файлы проверки и запускает судью через `docker exec`.
+    Набор тестов проверяемой посылки подкладывается в слот жесткими ссылками
+    (_link_test_set): контейнер видит только его, а не все TEST_SETS_DIR.
+    Изоляция та же, что и у `docker run --rm`: сеть, лимиты, read-only FS, appuser.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.idle = {}          # image -> [_PooledContainer]
+        self.max_idle = 0       # 0 = пул выключен, используем холодный запуск
+        self.enabled = False
+
+    def configure(self, max_idle):
+        with self.lock:
+            self.max_idle = max(0, int(max_idle))
+            self.enabled = self.max_idle > 0
+        # Слоты контейнеров от прошлого запуска сервера
+        shutil.rmtree(POOL_SLOTS_DIR, ignore_errors=True)
+
+    def _spawn(self, image):
+        os.makedirs(POOL_SLOTS_DIR, exist_ok=True)
+        slot_dir = tempfile.mkdtemp(prefix="judge_slot_", dir=POOL_SLOTS_DIR)
+        command = DOCKER_COMMON_ARGS + [
+            "-d", "--label", POOL_LABEL,
+            "-v", f"{_get_docker_path(os.path.abspath(slot_dir))}:/home/appuser/run:ro",
+            image, "sleep", "infinity"
+        ]
+        try:
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+        except Exception as e:
+            shutil.rmtree(slot_dir, ignore_errors=True)
+            print(f"POOL: Не удалось запустить контейнер {image}: {e}")
+            return None
+        container_id = result.stdout.decode('utf-8', errors='replace').strip()
+        if result.returncode != 0 or not container_id:
+            shutil.rmtree(slot_dir, ignore_errors=True)
+            print(f"POOL: Ошибка docker run для {image}: {result.stderr.decode('utf-8', errors='replace').strip()}")
+            return None
+        return _PooledContainer(image, container_id, slot_dir)
+
+    def _destroy(self, container):
+        try:
+            subprocess.run(["docker", "rm", "-f", container.container_id],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        except Exception:
+            pass
+        shutil.rmtree(container.slot_dir, ignore_errors=True)
+
+    def _reset(self, container):
+        """
+        Убивает оставшиеся процессы пользователя и чистит /tmp, /dev/shm, /dev/mqueue.
+        False - чистка не удалась или что-то осталось: контейнер будет пересоздан.
+        """
+        try:
+            result = subprocess.run(
+                ["docker", "exec", "-u", "appuser", container.container_id] + POOL_RESET_COMMAND,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15
+            )
+            if result.returncode != 0:
+                return False
+            _clear_dir(container.slot_dir)
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self, images, count=None):
+        """Заранее поднимает контейнеры (вызывается при старте сервера)."""
+        if not self.enabled:
+            return
+        count = self.max_idle if count is None else min(count, self.max_idle)
+        for image in images:
+            for _ in range(count):
+                container = self._spawn(image)
+                if not container:
+                    break
+                with self.lock:
+                    self.idle.setdefault(image, []).append(container)
+            print(f"POOL: {image}: готово {len(self.idle.get(image, []))} контейнеров")
+
+    def acquire(self, image):
+        """Возвращает свободный контейнер или запускает новый. None - пул недоступен."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            bucket = self.idle.get(image)
+            if bucket:
+                return bucket.pop()
+        return self._spawn(image)
+
+    def release(self, container, healthy=True):
+        """Возвращает контейнер в пул после сброса; сломанные и старые пересоздаются."""
+        container.jobs_done += 1
+        if (not healthy or container.jobs_done >= POOL_MAX_JOBS_PER_CONTAINER
+                or not self._reset(container)):
+            self._destroy(container)
+            return
+        with self.lock:
+            bucket = self.idle.setdefault(container.image, [])
+            if len(bucket) < self.max_idle:
+                bucket.append(container)
+                return
+        self._destroy(container)
+
+    def release_async(self, container, healthy=True):
+        """Сброс контейнера занимает время - не задерживаем им выдачу вердикта."""
+        Thread(target=self.release, args=(container, healthy), daemon=True).start()
+
+    def shutdown(self):
+        with self.lock:
+            containers = [c for bucket in self.idle.values() for c in bucket]
+            self.idle = {}
+            self.enabled = False
+        for container in containers:
+            self._destroy(container)
+
+container_pool = ContainerPool()
+
+class CompileCache:
+    """
+    Контентно-адресуемый кэш компиляции на хосте с LRU-вытеснением по размеру.
+    <key>.bin - собранный бинарник, <key>.err - текст ошибки компиляции.
+    Время последнего использования хранится в mtime файла.
+    """
+    IMAGE_ID_TTL = 60   # секунд между повторными docker image inspect
+    def __init__(self, cache_dir=COMPILE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.lock = RLock()
+        self.max_bytes = 0      # 0 = кэш выключен
+        self.total_bytes = None
+        self.image_ids = {}     # образ -> (ID, время проверки)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def configure(self, max_mb):
+        with self.lock:
+            self.max_bytes = max(0, int(max_mb)) * 1024 * 1024
+            self.total_bytes = None
+
+    def _image_id(self, image):
+        """
+        ID образа меняется при пересборке, т.е. при смене версии компилятора.
+        Запоминается на IMAGE_ID_TTL секунд, чтобы пересборка образа на ходу
+        подхватывалась; неудачный inspect не запоминается.
+        """
+        now = time.monotonic()
+        with self.lock:
+            cached = self.image_ids.get(image)
+            if cached and now - cached[1] < self.IMAGE_ID_TTL:
+                return cached[0]
+        try:
+            result = subprocess.run(["docker", "image", "inspect", "--format", "{{.Id}}", image],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=15)
+            image_id = result.stdout.decode('utf-8', errors='replace').strip() if result.returncode == 0 else None
+        except Exception:
+            image_id = None
+        if not image_id:
+            return None
+        with self.lock:
+            self.image_ids[image] = (image_id, now)
+        return image_id
+
+    def make_key(self, image, judge_script, code):
+        """None, если версию компилятора определить не удалось (тогда кэш не используется)."""
+        image_id = self._image_id(image)
+        if not image_id:
+            return None
+        h = hashlib.sha256()
+        for part in (image_id, judge_script, code):
+            h.update(part.encode('utf-8'))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def get(self, key):
+        """('binary', bytes), ('error', str) или None."""
+        if not self.enabled or not key:
+            return None
+        for ext, kind in ((".bin", "binary"), (".err", "error")):
+            path = self._path(key, ext)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path, None)  # Отмечаем использование для LRU
+            except OSError:
+                continue
+            return (kind, data) if kind == "binary" else (kind, data.decode('utf-8', errors='replace'))
+        return None
+
+    def put_binary(self, key, data):
+        self._store(self._path(key, ".bin"), data)
+
+    def put_error(self, key, message):
+        self._store(self._path(key, ".err"), message.encode('utf-8'))
+
+    def _scan(self):
+        total = 0
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            total += st.st_size
+            entries.append((st.st_mtime, st.st_size, path))
+        return total, entries
+
+    def _store(self, path, data):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        with self.lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                if self.total_bytes is None:
+                    self.total_bytes = self._scan()[0]
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self.total_bytes += len(data) - old_size
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+            except OSError as e:
+                print(f"COMPILE CACHE: Ошибка записи: {e}")
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока кэш не станет меньше 90% лимита."""
+        total, entries = self._scan()
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.total_bytes = total
+
+compile_cache = CompileCache()
+
+# Наборы тестов на диске: папка на набор (имя - хэш содержимого), внутри manifest.json
+# и пара файлов N.in / N.ans на тест. Набор пишется один раз и дальше только читается:
+# папка монтируется в песочницу read-only, в папке посылки остаются только код и раннер.
+TEST_SETS_DIR = os.path.join(BASE_DIR, 'test_data')
+TESTS_MOUNT = "/home/appuser/tests"
+
+def make_test_set_id(test_data_list):
+    """Хэш содержимого набора тестов (входы, ответы, лимиты) - имя его папки."""
+    h = hashlib.sha256()
+    for t in test_data_list:
+        test_input = (t.get('input') or '').encode('utf-8')
+        answer = (t.get('output') or '').encode('utf-8')
+        h.update(f"{len(test_input)}:{len(answer)}:{float(t.get('limit', 1.0))!r}\n".encode('ascii'))
+        h.update(test_input)
+        h.update(answer)
+    return h.hexdigest()
+
+class TestSetStore:
+    """
+    Общие read-only наборы тестов. Одна копия на версию набора тестов задачи,
+    сколько бы посылок ее ни проверяли. Раннер читает набор потестово (вход
+    подается в stdin прямо из файла), поэтому тесты не грузятся в память песочницы.
+    LRU-вытеснение по размеру (время использования - mtime папки); набор,
+    который сейчас проверяется, не удаляется.
+    """
+    def __init__(self, root=TEST_SETS_DIR):
+        self.root = root
+        self.lock = RLock()
+        self.max_bytes = 1024 * 1024 * 1024
+        self.in_use = {}        # test_set_id -> число идущих проверок
+
+    def configure(self, max_mb):
+        with self.lock:
+            self.max_bytes = max(0, int(max_mb)) * 1024 * 1024
+        # Недописанные наборы от прошлого запуска (сервер упал во время записи)
+        try:
+            for name in os.listdir(self.root):
+                if name.startswith("."):
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        except OSError:
+            pass
+
+    def acquire(self, test_data_list, test_set_id=None):
+        """
+        Возвращает (test_set_id, папка набора), создавая ее при первом обращении.
+        После проверки обязательно вызвать release(test_set_id).
+        """
+        test_set_id = test_set_id or make_test_set_id(test_data_list)
+        with self.lock:
+            self.in_use[test_set_id] = self.in_use.get(test_set_id, 0) + 1
+        try:
+            target = os.path.join(self.root, test_set_id)
+            if os.path.isdir(target):
+                try: os.utime(target, None)  # Отмечаем использование для LRU
+                except OSError: pass
+            else:
+                self._write(test_data_list, test_set_id, target)
+                self._evict()
+        except Exception:
+            self.release(test_set_id)
+            raise
+        return test_set_id, target
+
+    def release(self, test_set_id):
+        with self.lock:
+            count = self.in_use.get(test_set_id, 0) - 1
+            if count > 0:
+                self.in_use[test_set_id] = count
+            else:
+                self.in_use.pop(test_set_id, None)
+
+    def _write(self, test_data_list, test_set_id, target):
+        os.makedirs(self.root, exist_ok=True)
+        # Пишем во временную папку и переименовываем: песочница не увидит недописанный набор
+        tmp_dir = tempfile.mkdtemp(prefix=f".{test_set_id[:16]}-", dir=self.root)
+        try:
+            manifest = []
+            for i, t in enumerate(test_data_list, 1):
+                entry = {"input": f"{i}.in", "answer": f"{i}.ans", "limit": t.get('limit', 1.0)}
+                with open(os.path.join(tmp_dir, entry["input"]), "wb") as f:
+                    f.write((t.get('input') or '').encode('utf-8'))
+                with open(os.path.join(tmp_dir, entry["answer"]), "wb") as f:
+                    f.write((t.get('output') or '').encode('utf-8'))
+                manifest.append(entry)
+            with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({"tests": manifest}, f)
+            os.chmod(tmp_dir, 0o755)
+            os.rename(tmp_dir, target)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Тот же набор параллельно подготовил другой поток
+            if not os.path.isdir(target):
+                raise
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.stat(path).st_mtime, size, name))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self):
+        """Удаляет давно не использованные наборы, пока папка больше лимита."""
+        if self.max_bytes <= 0:
+            return
+        with self.lock:
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                if name in self.in_use:
+                    continue
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                total -= size
+                print(f"TEST DATA: Удален неиспользуемый набор тестов {name[:12]}")
+
+test_set_store = TestSetStore()
+
+class VerdictCache:
+    """
+    LRU-кэш вердиктов в памяти.
+    Ключ: код, язык, задача + версия набора тестов, код чекера и режим остановки.
+    Кэшируются только детерминированные результаты (без TLE и системных ошибок).
+    """
+    UNCACHEABLE_VERDICTS = {"Time Limit Exceeded", "Internal Error", "Judge Error", "System Error"}
+    MAX_ENTRY_OUTPUT = 1024 * 1024  # Не держим в памяти результаты с огромным выводом
+
+    def __init__(self):
+        self.lock = RLock()
+        self.entries = OrderedDict()
+        self.max_entries = 0        # 0 = кэш выключен
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def configure(self, max_entries):
+        with self.lock:
+            self.max_entries = max(0, int(max_entries))
+            self.entries.clear()
+
+    def make_key(self, language, code, task_id, tests_version, checker_code, stop_on_failure):
+        h = hashlib.sha256()
+        for part in (language, code, str(task_id), str(tests_version), checker_code or "", str(bool(stop_on_failure))):
+            h.update(part.encode('utf-8'))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            verdicts = self.entries.get(key)
+            if verdicts is None:
+                return None
+            self.entries.move_to_end(key)
+        return [dict(v) for v in verdicts]
+
+    def put(self, key, verdicts):
+        if not self.enabled or not verdicts:
+            return
+        if any(v.get('verdict') in self.UNCACHEABLE_VERDICTS for v in verdicts):
+            return
+        # Ошибка компиляции из-за нагрузки на сервер (OOM, таймаут) - не ответ на этот код
+        if any(v.get('verdict') == "Compilation Error" and not _is_cacheable_compile_error(v) for v in verdicts):
+            return
+        if sum(len(v.get('output') or '') + len(v.get('error') or '') for v in verdicts) > self.MAX_ENTRY_OUTPUT:
+            return
+        with self.lock:
+            self.entries[key] = [dict(v) for v in verdicts]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+verdict_cache = VerdictCache()
+
+class TaskDataCache:
+    """
+    LRU-кэш данных для проверки: подготовленные тесты и чекер задачи.
+    Запись помечена версией (DBManager.tests_versions) и считается устаревшей,
+    как только тесты или задача изменились. Размер ограничен в байтах тестов.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.entries = OrderedDict()    # task_id -> (данные, размер)
+        self.max_bytes = 256 * 1024 * 1024
+        self.total_bytes = 0
+
+    def configure(self, max_mb):
+        with self.lock:
+            self.max_bytes = max(0, int(max_mb)) * 1024 * 1024
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get(self, task_id, version):
+        with self.lock:
+            entry = self.entries.get(task_id)
+            if entry is None or entry[0]['version'] != version:
+                return None
+            self.entries.move_to_end(task_id)
+            return entry[0]
+
+    def put(self, task_id, data):
+        size = sum(len(t['input']) + len(t['output']) for t in data['tests'])
+        with self.lock:
+            old = self.entries.pop(task_id, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self.entries[task_id] = (data, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+# Код посылок длиннее этого порога хранится сжатым (zlib)
+CODE_COMPRESS_MIN = 1024
+
+def _pack_code(code):
+    """(значение для БД, сжато ли)."""
+    data = (code or "").encode('utf-8')
+    if len(data) >= CODE_COMPRESS_MIN:
+        return sqlite3.Binary(zlib.compress(data)), True
+    return code or "", False
+
+def _unpack_code(value, compressed):
+    if value is None:
+        return ""
+    if compressed:
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+# Версионные миграции схемы: (версия, описание, [SQL]).
+# Текущая версия хранится в PRAGMA user_version; новые миграции только добавляются в конец.
+SCHEMA_MIGRATIONS = [
+    (1, "индексы истории посылок, тестов и результатов", [
+        # get_participant_history (ORDER BY id идет по тому же индексу)
+        "CREATE INDEX IF NOT EXISTS idx_history_participant ON olympiad_history (olympiad_id, participant_id)",
+        # Заморозка: посылки до/после момента заморозки, время старта при восстановлении
+        "CREATE INDEX IF NOT EXISTS idx_history_time ON olympiad_history (olympiad_id, timestamp)",
+        # get_first_solvers: принятые посылки по задачам
+        "CREATE INDEX IF NOT EXISTS idx_history_solves ON olympiad_history (olympiad_id, verdict, task_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_tests_task ON tests (task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_results_nickname ON olympiad_results (olympiad_id, nickname)",
+    ]),
+    (2, "запись журнала очереди в истории посылок", [
+        # Повторная проверка посылки из журнала после сбоя не дублирует строку истории
+        "ALTER TABLE olympiad_history ADD COLUMN journal_id INTEGER",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_history_journal ON olympiad_history (journal_id) WHERE journal_id IS NOT NULL",
+    ]),
+]
+
+class SQLiteConnectionPool:
+    """
+    Ограниченный пул соединений SQLite.
+    Соединение создается один раз (PRAGMA и кэш подготовленных запросов живут
+    вместе с ним) и возвращается в пул после запроса. Если пул исчерпан,
+    запрос ждет свободное соединение; ожидания считаются в stats().
+    Вложенный _get_conn() в том же потоке/гринлете получает то же соединение.
+    """
+    def __init__(self, factory, size=8):
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.cond = Condition()
+        self.idle = []
+        self.opened = 0
+        self.local = local()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        with self.cond:
+            self.checkouts += 1
+            if not self.idle and self.opened >= self.size:
+                started = time.time()
+                self.cond.wait_for(lambda: self.idle or self.opened < self.size)
+                waited = time.time() - started
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self.cond:
+                self.opened -= 1
+                self.cond.notify()
+            raise
+
+    def release(self, conn, broken=False):
+        with self.cond:
+            if broken or len(self.idle) + 1 > self.size:
+                self.opened -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self.idle.append(conn)
+            self.cond.notify()
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'size': self.size,
+                'open': self.opened,
+                'idle': len(self.idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_ms_total': round(self.wait_total * 1000, 1),
+                'wait_ms_max': round(self.wait_max * 1000, 1)
+            }
+
+class _PooledConnection:
+    """
+    with db._get_conn() as conn: - как у sqlite3.Connection (commit / rollback при выходе),
+    но соединение не остается висеть, а возвращается в пул.
+    Вложенный with в том же потоке получает то же соединение и транзакцию не завершает:
+    commit / rollback делает только внешний блок (исключение просто пробрасывается).
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+        self.outer = False
+
+    def __enter__(self):
+        held = getattr(self.pool.local, 'conn', None)
+        if held is not None:
+            self.conn = held
+            return held
+        self.conn = self.pool.acquire()
+        self.pool.local.conn = self.conn
+        self.outer = True
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.outer:
+            return False
+        broken = False
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        except sqlite3.Error:
+            broken = True
+            if exc_type is None:
+                raise
+        finally:
+            self.pool.local.conn = None
+            self.pool.release(self.conn, broken=broken)
+        return False
+
 class DBManager:
-    def __init__(self, db_name="testirovschik.db"):
+    def __init__(self, db_name="testirovschik.db", pool_size=8):
         self.db_name = db_name
+        # Соединения переиспользуются: PRAGMA выполняются один раз на соединение
+        self.pool = SQLiteConnectionPool(self._connect, pool_size)
         # Блокировка ТОЛЬКО для записи. Чтение работает параллельно.
         self.write_lock = RLock()
         
+        # Версия набора тестов каждой задачи (для кэша вердиктов и кэша данных проверки).
+        # Увеличивается при любом изменении тестов или задачи.
+        self.tests_versions = {}
+        self.judge_cache = TaskDataCache()
+        
         # Инициализация режима WAL (Write-Ahead Logging) для параллелизма
         try:
             with self._get_conn() as conn:
@@ -64,33 +749,65 @@ class DBManager:
         
         self.create_tables()
         self._create_olympiad_tables()
+        self._apply_migrations()
 
-    def _get_conn(self):
+    def get_schema_version(self):
+        with self._get_conn() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _apply_migrations(self):
+        """Применяет миграции из SCHEMA_MIGRATIONS новее текущей версии схемы."""
+        with self.write_lock:
+            with self._get_conn() as conn:
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                for version, description, statements in SCHEMA_MIGRATIONS:
+                    if version <= current:
+                        continue
+                    for sql in statements:
+                        conn.execute(sql)
+                    conn.execute(f"PRAGMA user_version = {int(version)}")
+                    conn.commit()
+                    print(f"DB: Схема обновлена до версии {version} ({description})")
+
+    def _connect(self):
         """
-        Создает изолированное соединение для каждого запроса.
-        Позволяет избежать DB Lock Bottleneck при чтении.
+        Новое соединение для пула.
+        Несколько соединений позволяют избежать DB Lock Bottleneck при чтении.
         Оптимизировано для конкурсов с 100 участниками.
         """
         # Timeout 120s важен для очереди на запись при 100 участниках
-        conn = sqlite3.connect(self.db_name, timeout=120.0, check_same_thread=False)
+        # cached_statements - кэш подготовленных запросов (живет, пока живет соединение)
+        conn = sqlite3.connect(self.db_name, timeout=120.0, check_same_thread=False, cached_statements=256)
         # PRAGMA оптимизации для высоконагруженных соревнований
         conn.execute("PRAGMA synchronous=NORMAL;")  # Баланс безопасности и скорости
-        conn.execute("PRAGMA cache_size=-128000;")   # 128MB кэша для лучшей производительности
+        # Кэш страниц теперь живет, пока соединение в пуле, поэтому он меньше, чем был у одноразовых (128MB)
+        conn.execute("PRAGMA cache_size=-32000;")    # 32MB кэша на соединение
         conn.execute("PRAGMA temp_store=MEMORY;")    # Временные таблицы в RAM
         conn.execute("PRAGMA mmap_size=268435456;")  # 256MB memory-mapped I/O
         conn.execute("PRAGMA page_size=4096;")       # Оптимальный размер страницы
         conn.row_factory = sqlite3.Row
         return conn
 
+    def _get_conn(self):
+        """Соединение из пула: with self._get_conn() as conn: ..."""
+        return self.pool.connection()
+
     # === ИСТОРИЯ (Запись - нужен лок) ===
-    def add_to_history(self, olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests):
+    def add_to_history(self, olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests,
+                       journal_id=None):
+        """
+        journal_id - запись журнала очереди этой посылки. Результат пишется отложенно
+        (write_behind.py), и после сбоя посылка проверяется заново: вторая строка
+        истории с тем же journal_id пропускается.
+        """
         with self.write_lock:
             with self._get_conn() as conn:
                 conn.execute("""
-                    INSERT INTO olympiad_history 
-                    (olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests, time.time()))
+                    INSERT OR IGNORE INTO olympiad_history 
+                    (olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests, timestamp, journal_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (olympiad_id, participant_id, task_id, language, verdict, tests_passed, total_tests, time.time(),
+                      journal_id))
                 conn.commit()
 
     # === ИСТОРИЯ (Чтение - без лока) ===
@@ -121,6 +838,23 @@ class DBManager:
                                 UNIQUE(olympiad_id, participant_uuid)
                             )''')
                 
+                # Баллы по задачам: строка на (олимпиада, участник, задача) вместо JSON в task_scores.
+                # Вердикт меняет одну ячейку, загрузка архива не разбирает JSON
+                c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='olympiad_task_scores'")
+                migrate_task_scores = c.fetchone() is None
+                c.execute('''CREATE TABLE IF NOT EXISTS olympiad_task_scores (
+                                olympiad_id TEXT NOT NULL,
+                                participant_uuid TEXT NOT NULL,
+                                task_id INTEGER NOT NULL,
+                                score INTEGER DEFAULT 0,
+                                attempts INTEGER DEFAULT 0,
+                                passed BOOLEAN DEFAULT 0,
+                                penalty INTEGER DEFAULT 0,
+                                PRIMARY KEY (olympiad_id, participant_uuid, task_id)
+                            )''')
+                if migrate_task_scores:
+                    self._migrate_task_scores(c)
+
                 c.execute('''CREATE TABLE IF NOT EXISTS olympiad_configs (
                                 olympiad_id TEXT PRIMARY KEY,
                                 task_ids_json TEXT,
@@ -160,6 +894,35 @@ class DBManager:
                                 UNIQUE(olympiad_id, participant_uuid)
                             )''')
                 
+                # Последний код участника по каждой задаче: посылка переписывает одну строку,
+                # а не весь JSON olympiad_submissions.task_submissions
+                c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='olympiad_task_code'")
+                migrate_task_code = c.fetchone() is None
+                c.execute('''CREATE TABLE IF NOT EXISTS olympiad_task_code (
+                                olympiad_id TEXT NOT NULL,
+                                participant_uuid TEXT NOT NULL,
+                                task_id INTEGER NOT NULL,
+                                code BLOB,
+                                compressed BOOLEAN DEFAULT 0,
+                                updated_at REAL,
+                                PRIMARY KEY (olympiad_id, participant_uuid, task_id)
+                            )''')
+                if migrate_task_code:
+                    self._migrate_task_code(c)
+
+                # Все отправленные решения (только добавление) - для просмотра прошлых попыток
+                c.execute('''CREATE TABLE IF NOT EXISTS olympiad_code_history (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                olympiad_id TEXT NOT NULL,
+                                participant_uuid TEXT NOT NULL,
+                                task_id INTEGER NOT NULL,
+                                language TEXT,
+                                code BLOB,
+                                compressed BOOLEAN DEFAULT 0,
+                                submitted_at REAL
+                            )''')
+                c.execute("CREATE INDEX IF NOT EXISTS idx_code_history_participant ON olympiad_code_history (olympiad_id, participant_uuid, task_id)")
+
                 c.execute('''CREATE TABLE IF NOT EXISTS olympiad_whitelist (
                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                                 olympiad_id TEXT NOT NULL,
@@ -187,8 +950,106 @@ class DBManager:
                                 config_json TEXT,
                                 task_ids_json TEXT
                             )''')
+                # Журнал очереди проверки: запись живет от постановки в очередь до сохранения результата.
+                # После перезапуска сервера все оставшиеся записи проверяются заново.
+                c.execute('''CREATE TABLE IF NOT EXISTS submission_queue (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                olympiad_id TEXT NOT NULL,
+                                participant_uuid TEXT NOT NULL,
+                                task_id INTEGER NOT NULL,
+                                language TEXT,
+                                code TEXT,
+                                scoring_mode TEXT,
+                                first_attempt BOOLEAN DEFAULT 0,
+                                enqueued_at REAL
+                            )''')
                 conn.commit()
 
+    def _migrate_task_scores(self, c):
+        """
+        Перенос JSON из olympiad_results.task_scores в olympiad_task_scores (один раз).
+        Старая колонка остается как есть (копия на случай отката), ее больше не читают.
+        """
+        c.execute("SELECT olympiad_id, participant_uuid, task_scores FROM olympiad_results WHERE task_scores IS NOT NULL")
+        rows = []
+        for r in c.fetchall():
+            try:
+                scores = json.loads(r['task_scores']) or {}
+            except (ValueError, TypeError):
+                continue
+            for k, v in scores.items():
+                try:
+                    task_id = int(k)
+                except (ValueError, TypeError):
+                    continue
+                if not isinstance(v, dict):
+                    # Старый формат: просто число баллов
+                    v = {'score': int(v) if isinstance(v, (int, float)) else 0}
+                rows.append((r['olympiad_id'], r['participant_uuid'], task_id, v.get('score', 0),
+                             v.get('attempts', 0), bool(v.get('passed', False)), v.get('penalty', 0)))
+        c.executemany("""
+            INSERT OR REPLACE INTO olympiad_task_scores
+            (olympiad_id, participant_uuid, task_id, score, attempts, passed, penalty)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        if rows:
+            print(f"DB: Баллы перенесены в olympiad_task_scores ({len(rows)} строк)")
+
+    def _migrate_task_code(self, c):
+        """
+        Перенос JSON из olympiad_submissions.task_submissions в olympiad_task_code (один раз).
+        Старая колонка остается как есть (копия на случай отката), ее больше не читают.
+        """
+        c.execute("SELECT olympiad_id, participant_uuid, task_submissions FROM olympiad_submissions WHERE task_submissions IS NOT NULL")
+        rows = []
+        for r in c.fetchall():
+            try:
+                submissions = json.loads(r['task_submissions']) or {}
+            except (ValueError, TypeError):
+                continue
+            for k, code in submissions.items():
+                if not code:
+                    continue
+                try:
+                    task_id = int(k)
+                except (ValueError, TypeError):
+                    continue
+                value, compressed = _pack_code(code)
+                rows.append((r['olympiad_id'], r['participant_uuid'], task_id, value, compressed))
+        c.executemany("""
+            INSERT OR REPLACE INTO olympiad_task_code (olympiad_id, participant_uuid, task_id, code, compressed)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+        if rows:
+            print(f"DB: Код посылок перенесен в olympiad_task_code ({len(rows)} строк)")
+
+    def _load_task_code(self, c, olympiad_id, participant_uuid=None):
+        """{participant_uuid: {"task_id": код}} - ключи задач строками, как раньше в JSON."""
+        query = "SELECT participant_uuid, task_id, code, compressed FROM olympiad_task_code WHERE olympiad_id = ?"
+        params = [olympiad_id]
+        if participant_uuid is not None:
+            query += " AND participant_uuid = ?"
+            params.append(participant_uuid)
+        result = {}
+        for r in c.execute(query, params):
+            result.setdefault(r['participant_uuid'], {})[str(r['task_id'])] = _unpack_code(r['code'], r['compressed'])
+        return result
+
+    def _load_task_scores(self, c, olympiad_id, participant_uuid=None):
+        """{participant_uuid: {task_id: {score, attempts, passed, penalty}}} из olympiad_task_scores."""
+        query = "SELECT participant_uuid, task_id, score, attempts, passed, penalty FROM olympiad_task_scores WHERE olympiad_id = ?"
+        params = [olympiad_id]
+        if participant_uuid is not None:
+            query += " AND participant_uuid = ?"
+            params.append(participant_uuid)
+        result = {}
+        for r in c.execute(query, params):
+            result.setdefault(r['participant_uuid'], {})[r['task_id']] = {
+                'score': r['score'], 'attempts': r['attempts'],
+                'passed': bool(r['passed']), 'penalty': r['penalty']
+            }
+        return result
+
     def save_olympiad_config(self, olympiad_id, task_ids_list, name=None, duration=None, scoring=None, allowed_languages=None, freeze_minutes=None):
         ids_json = json.dumps(task_ids_list)
         languages_json = json.dumps(allowed_languages) if allowed_languages else None
@@ -233,36 +1094,60 @@ class DBManager:
                           (start_time, olympiad_id))
                 conn.commit()
 
-    def save_olympiad_data(self, olympiad_id, olympiad_data):
+    def _upsert_participant(self, c, olympiad_id, p_uuid, p_data):
+        nickname = p_data.get('nickname')
+        organization = p_data.get('organization', None) 
+        disqualified = p_data.get('disqualified', False)
+        scores = p_data.get('scores', {})
+        
+        total_score = sum(s.get('score', 0) for s in scores.values())
+        
+        c.execute("""
+            INSERT INTO olympiad_results (olympiad_id, participant_uuid, nickname, organization, total_score, disqualified)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(olympiad_id, participant_uuid) DO UPDATE SET
+            organization=excluded.organization, total_score=excluded.total_score,
+            disqualified=excluded.disqualified
+        """, (olympiad_id, p_uuid, nickname, organization, total_score, disqualified))
+        # Неизменившиеся ячейки не переписываются (WHERE в DO UPDATE)
+        c.executemany("""
+            INSERT INTO olympiad_task_scores (olympiad_id, participant_uuid, task_id, score, attempts, passed, penalty)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(olympiad_id, participant_uuid, task_id) DO UPDATE SET
+            score=excluded.score, attempts=excluded.attempts, passed=excluded.passed, penalty=excluded.penalty
+            WHERE score IS NOT excluded.score OR attempts IS NOT excluded.attempts
+               OR passed IS NOT excluded.passed OR penalty IS NOT excluded.penalty
+        """, [(olympiad_id, p_uuid, int(t_id), s.get('score', 0), s.get('attempts', 0),
+               bool(s.get('passed', False)), s.get('penalty', 0)) for t_id, s in scores.items()])
+
+    def save_olympiad_data(self, olympiad_id, olympiad_data, dequeue_id=None):
+        """
+        Сохраняет результаты всех участников.
+        dequeue_id - запись журнала очереди, которая удаляется в той же транзакции.
+        """
         with self.write_lock:
             with self._get_conn() as conn:
                 c = conn.cursor()
                 participants = olympiad_data.get('participants', {})
                 for p_uuid, p_data in participants.items():
-                    nickname = p_data.get('nickname')
-                    organization = p_data.get('organization', None) 
-                    disqualified = p_data.get('disqualified', False)
-                    scores = p_data.get('scores', {})
-                    
-                    total_score = sum(s.get('score', 0) for s in scores.values())
-                    task_scores_json = json.dumps(scores) 
-                    
-                    c.execute("""
-                        INSERT INTO olympiad_results (olympiad_id, participant_uuid, nickname, organization, total_score, task_scores, disqualified)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ON CONFLICT(olympiad_id, participant_uuid) DO UPDATE SET
-                        organization=excluded.organization, total_score=excluded.total_score, task_scores=excluded.task_scores,
-                        disqualified=excluded.disqualified
-                    """, (olympiad_id, p_uuid, nickname, organization, total_score, task_scores_json, disqualified))
-                    
-                    submissions = p_data.get('last_submissions', {})
-                    submissions_json = json.dumps(submissions)
-                    c.execute("""
-                        INSERT INTO olympiad_submissions (olympiad_id, participant_uuid, nickname, task_submissions)
-                        VALUES (?, ?, ?, ?)
-                        ON CONFLICT(olympiad_id, participant_uuid) DO UPDATE SET
-                        task_submissions=excluded.task_submissions
-                    """, (olympiad_id, p_uuid, nickname, submissions_json))
+                    self._upsert_participant(c, olympiad_id, p_uuid, p_data)
+                if dequeue_id is not None:
+                    c.execute("DELETE FROM submission_queue WHERE id = ?", (dequeue_id,))
+                conn.commit()
+
+    def save_participant_rows(self, rows, dequeue_ids=()):
+        """
+        Пакетная запись измененных участников (write-behind).
+        rows: {(olympiad_id, participant_uuid): данные участника}.
+        Записи журнала dequeue_ids удаляются в той же транзакции.
+        """
+        with self.write_lock:
+            with self._get_conn() as conn:
+                c = conn.cursor()
+                for (olympiad_id, p_uuid), p_data in rows.items():
+                    self._upsert_participant(c, olympiad_id, p_uuid, p_data)
+                if dequeue_ids:
+                    c.executemany("DELETE FROM submission_queue WHERE id = ?", [(i,) for i in dequeue_ids])
                 conn.commit()
 
     def get_first_solvers(self, olympiad_id):
@@ -286,9 +1171,7 @@ class DBManager:
             participants_raw = c.fetchall()
             if not participants_raw: return None 
 
-            c.execute("SELECT participant_uuid, task_submissions FROM olympiad_submissions WHERE olympiad_id = ?", (olympiad_id,))
-            submissions_raw = c.fetchall()
-            submissions_map = {s['participant_uuid']: json.loads(s['task_submissions']) for s in submissions_raw if s['task_submissions']}
+            submissions_map = self._load_task_code(c, olympiad_id)
 
             c.execute("SELECT * FROM olympiad_configs WHERE olympiad_id = ?", (olympiad_id,))
             config_row = c.fetchone()
@@ -302,25 +1185,10 @@ class DBManager:
             # [FIX] Флаг для автоопределения IOI (если были баллы > 1)
             looks_like_ioi = False
             
-            for p in participants_raw:
-                scores_full = json.loads(p['task_scores']) 
+            task_scores_map = self._load_task_scores(c, olympiad_id)
 
-                # [FIX START] Исправление дублирования ключей (str vs int)
-                scores_fixed = {}
-                for k, v in scores_full.items():
-                    try:
-                        int_k = int(k)
-                    except (ValueError, TypeError):
-                        int_k = k
-                    
-                    # [FIX] Гарантируем правильную структуру данных
-                    if isinstance(v, dict):
-                        scores_fixed[int_k] = v
-                    else:
-                        # Если это просто число (старый формат), преобразуем
-                        scores_fixed[int_k] = {'score': int(v) if isinstance(v, (int, float)) else 0, 'attempts': 0, 'passed': False, 'penalty': 0}
-                scores_full = scores_fixed
-                # [FIX END]
+            for p in participants_raw:
+                scores_full = task_scores_map.get(p['participant_uuid'], {})
 
                 task_ids_set.update(scores_full.keys())
                 uuid = p['participant_uuid']
@@ -331,10 +1199,6 @@ class DBManager:
                 solved_count = 0
                 
                 for tid, info in scores_full.items():
-                    if isinstance(info, int):
-                        info = {'score': info, 'attempts': 0, 'passed': False, 'penalty': 0}
-                        scores_full[tid] = info
-                    
                     s_val = info.get('score', 0)
                     total_score_calc += s_val
                     
@@ -421,6 +1285,9 @@ class DBManager:
                                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                                  FOREIGN KEY(task_id) REFERENCES tasks(id)
                                )''')
+                # Миграции
+                cols = [col[1] for col in conn.execute("PRAGMA table_info(tasks)").fetchall()]
+                if "verdict_cache" not in cols: conn.execute("ALTER TABLE tasks ADD COLUMN verdict_cache BOOLEAN DEFAULT 1")
                 conn.commit()
     
     def add_submission(self, task_id, language, code, result):
@@ -447,7 +1314,10 @@ class DBManager:
             try:
                 with self._get_conn() as conn:
                     conn.execute("DELETE FROM olympiad_results WHERE olympiad_id = ?", (olympiad_id,))
+                    conn.execute("DELETE FROM olympiad_task_scores WHERE olympiad_id = ?", (olympiad_id,))
                     conn.execute("DELETE FROM olympiad_submissions WHERE olympiad_id = ?", (olympiad_id,))
+                    conn.execute("DELETE FROM olympiad_task_code WHERE olympiad_id = ?", (olympiad_id,))
+                    conn.execute("DELETE FROM olympiad_code_history WHERE olympiad_id = ?", (olympiad_id,))
                     conn.execute("DELETE FROM olympiad_configs WHERE olympiad_id = ?", (olympiad_id,))
                     conn.execute("DELETE FROM olympiad_history WHERE olympiad_id = ?", (olympiad_id,))
                     conn.commit()
@@ -489,11 +1359,11 @@ class DBManager:
             c.execute("SELECT * FROM olympiad_whitelist WHERE olympiad_id = ? AND nickname = ? AND password = ?", (olympiad_id, nickname, password))
             return c.fetchone()
         
-    def add_task(self, title, difficulty, topic, description, attachment, file_format, checker_code=None):
+    def add_task(self, title, difficulty, topic, description, attachment, file_format, checker_code=None, verdict_cache=True):
         with self.write_lock:
             with self._get_conn() as conn:
-                conn.execute("INSERT INTO tasks (title, difficulty, topic, description, attachment, file_format, checker_code) VALUES (?,?,?,?,?,?,?)",
-                          (title, difficulty, topic, description, attachment, file_format, checker_code))
+                conn.execute("INSERT INTO tasks (title, difficulty, topic, description, attachment, file_format, checker_code, verdict_cache) VALUES (?,?,?,?,?,?,?,?)",
+                          (title, difficulty, topic, description, attachment, file_format, checker_code, verdict_cache))
                 conn.commit()
 
     def get_tasks(self):
@@ -508,16 +1378,18 @@ class DBManager:
             c.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
             return c.fetchone()
 
-    def update_task(self, task_id, title, difficulty, topic, description, attachment, file_format, checker_code=None):
+    def update_task(self, task_id, title, difficulty, topic, description, attachment, file_format, checker_code=None, verdict_cache=True):
         with self.write_lock:
             with self._get_conn() as conn:
                 if attachment and file_format:
-                     conn.execute("UPDATE tasks SET title=?, difficulty=?, topic=?, description=?, attachment=?, file_format=?, checker_code=? WHERE id=?",
-                               (title, difficulty, topic, description, attachment, file_format, checker_code, task_id))
+                     conn.execute("UPDATE tasks SET title=?, difficulty=?, topic=?, description=?, attachment=?, file_format=?, checker_code=?, verdict_cache=? WHERE id=?",
+                               (title, difficulty, topic, description, attachment, file_format, checker_code, verdict_cache, task_id))
                 else:
-                    conn.execute("UPDATE tasks SET title=?, difficulty=?, topic=?, description=?, checker_code=? WHERE id=?",
-                               (title, difficulty, topic, description, checker_code, task_id))
+                    conn.execute("UPDATE tasks SET title=?, difficulty=?, topic=?, description=?, checker_code=?, verdict_cache=? WHERE id=?",
+                               (title, difficulty, topic, description, checker_code, verdict_cache, task_id))
                 conn.commit()
+            # Мог измениться чекер - данные проверки и вердикты устарели
+            self._bump_tests_version(task_id)
 
     def mark_olympiad_finished(self, olympiad_id):
         with self.write_lock:
@@ -531,6 +1403,62 @@ class DBManager:
                 conn.execute("DELETE FROM tests WHERE task_id=?", (task_id,))
                 conn.execute("DELETE FROM tasks WHERE id=?", (task_id,))
                 conn.commit()
+            self._bump_tests_version(task_id)
+
+    # === ВЕРСИЯ НАБОРА ТЕСТОВ ===
+    def get_tests_version(self, task_id):
+        with self.write_lock:
+            return self.tests_versions.get(int(task_id), 0)
+
+    def _bump_tests_version(self, task_id):
+        with self.write_lock:
+            task_id = int(task_id)
+            self.tests_versions[task_id] = self.tests_versions.get(task_id, 0) + 1
+
+    # === ДАННЫЕ ДЛЯ ПРОВЕРКИ (кэш) ===
+    def get_judge_data(self, task_id):
+        """
+        Все, что нужно для проверки посылки:
+        {'version', 'exists', 'tests' (CRLF -> LF), 'test_set_id', 'checker_code', 'verdict_cache'}.
+        Берется из кэша, пока не изменились тесты или задача. Вложение (PDF) не читается.
+        Результат общий для всех посылок - не изменять.
+        """
+        task_id = int(task_id)
+        # Версию берём ДО чтения, чтобы не закэшировать устаревший набор
+        version = self.get_tests_version(task_id)
+        data = self.judge_cache.get(task_id, version)
+        if data is not None:
+            return data
+        with self._get_conn() as conn:
+            task = conn.execute("SELECT checker_code, verdict_cache FROM tasks WHERE id=?", (task_id,)).fetchone()
+            tests = conn.execute("SELECT test_input, expected_output, time_limit FROM tests WHERE task_id=? ORDER BY id",
+                                 (task_id,)).fetchall()
+        data = {
+            'version': version,
+            'exists': task is not None,
+            'tests': [
+                {
+                    'input': t['test_input'].replace('\r\n', '\n') if t['test_input'] else '',
+                    'output': t['expected_output'].replace('\r\n', '\n') if t['expected_output'] else '',
+                    'limit': t['time_limit']
+                } for t in tests
+            ],
+            'checker_code': task['checker_code'] if task else None,
+            # Кэш вердиктов можно отключить для задачи (например, с недетерминированным чекером)
+            'verdict_cache': bool(task['verdict_cache']) if task and task['verdict_cache'] is not None else task is not None
+        }
+        # Хэш набора считается один раз на версию, а не на каждую посылку
+        data['test_set_id'] = make_test_set_id(data['tests'])
+        self.judge_cache.put(task_id, data)
+        return data
+
+    def prewarm_judge_data(self, task_ids):
+        """Загружает в кэш данные проверки задач олимпиады (при старте)."""
+        for task_id in task_ids:
+            try:
+                self.get_judge_data(task_id)
+            except Exception as e:
+                print(f"DB Error prewarming task {task_id}: {e}")
 
     def add_test(self, task_id, test_input, expected_output, time_limit):
         with self.write_lock:
@@ -538,6 +1466,7 @@ class DBManager:
                 conn.execute("INSERT INTO tests (task_id, test_input, expected_output, time_limit) VALUES (?,?,?,?)",
                           (task_id, test_input, expected_output, time_limit))
                 conn.commit()
+            self._bump_tests_version(task_id)
 
     def get_tests_for_task(self, task_id):
         with self._get_conn() as conn:
@@ -554,36 +1483,32 @@ class DBManager:
     def update_test(self, test_id, test_input, expected_output, time_limit):
         with self.write_lock:
             with self._get_conn() as conn:
+                row = conn.execute("SELECT task_id FROM tests WHERE id=?", (test_id,)).fetchone()
                 conn.execute("UPDATE tests SET test_input=?, expected_output=?, time_limit=? WHERE id=?", (test_input, expected_output, time_limit, test_id))
                 conn.commit()
+            if row:
+                self._bump_tests_version(row['task_id'])
 
     def delete_test(self, test_id):
         with self.write_lock:
             with self._get_conn() as conn:
+                row = conn.execute("SELECT task_id FROM tests WHERE id=?", (test_id,)).fetchone()
                 conn.execute("DELETE FROM tests WHERE id=?", (test_id,))
                 conn.commit()
+            if row:
+                self._bump_tests_version(row['task_id'])
     
     def get_participant_progress(self, olympiad_id, participant_uuid):
         with self._get_conn() as conn:
             c = conn.cursor()
-            c.execute("SELECT task_scores, disqualified, organization FROM olympiad_results WHERE olympiad_id = ? AND participant_uuid = ?", (olympiad_id, participant_uuid))
+            c.execute("SELECT disqualified, organization FROM olympiad_results WHERE olympiad_id = ? AND participant_uuid = ?", (olympiad_id, participant_uuid))
             row_res = c.fetchone()
             if not row_res: return None
             
-            c.execute("SELECT task_submissions FROM olympiad_submissions WHERE olympiad_id = ? AND participant_uuid = ?", (olympiad_id, participant_uuid))
-            row_sub = c.fetchone()
-            last_submissions = json.loads(row_sub['task_submissions']) if row_sub and row_sub['task_submissions'] else {}
-            raw_scores = json.loads(row_res['task_scores'])
-            # [FIX START] Принудительная конвертация ключей в int
-            scores_fixed = {}
-            for k, v in raw_scores.items():
-                try:
-                    scores_fixed[int(k)] = v
-                except ValueError:
-                    scores_fixed[k] = v
-            # [FIX END]
+            last_submissions = self._load_task_code(c, olympiad_id, participant_uuid).get(participant_uuid, {})
+            scores = self._load_task_scores(c, olympiad_id, participant_uuid).get(participant_uuid, {})
             return {
-                'scores': scores_fixed,
+                'scores': scores,
                 'disqualified': row_res['disqualified'],
                 'organization': row_res['organization'],
                 'last_submissions': last_submissions
@@ -764,31 +1689,81 @@ class DBManager:
             row = c.fetchone()
             return row['freeze_minutes'] if row and row['freeze_minutes'] else None
     
-    def update_submission_immediate(self, olympiad_id, participant_uuid, nickname, task_id, code):
+    def update_submission_immediate(self, olympiad_id, participant_uuid, task_id, code, language=None, queue_item=None):
+        """
+        Сохраняет код посылки: перезаписывает одну строку (участник, задача)
+        и добавляет попытку в историю. Если передан queue_item, в той же транзакции
+        пишет его в журнал очереди и возвращает id записи, иначе None.
+        Ошибка записи логируется, возвращается None (посылка не в журнале).
+        """
+        if language is None and queue_item is not None:
+            language = queue_item.get('language')
+        value, compressed = _pack_code(code)
+        now = time.time()
         with self.write_lock:
             try:
                 with self._get_conn() as conn:
                     c = conn.cursor()
-                    c.execute("SELECT task_submissions FROM olympiad_submissions WHERE olympiad_id = ? AND participant_uuid = ?", 
-                              (olympiad_id, participant_uuid))
-                    row = c.fetchone()
-                    
-                    submissions = json.loads(row['task_submissions']) if row and row['task_submissions'] else {}
-                    submissions[str(task_id)] = code
-                    submissions_json = json.dumps(submissions)
-
                     c.execute("""
-                        INSERT INTO olympiad_submissions (olympiad_id, participant_uuid, nickname, task_submissions)
-                        VALUES (?, ?, ?, ?)
-                        ON CONFLICT(olympiad_id, participant_uuid) DO UPDATE SET
-                        task_submissions=excluded.task_submissions,
-                        nickname=excluded.nickname
-                    """, (olympiad_id, participant_uuid, nickname, submissions_json))
+                        INSERT INTO olympiad_task_code (olympiad_id, participant_uuid, task_id, code, compressed, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(olympiad_id, participant_uuid, task_id) DO UPDATE SET
+                        code=excluded.code, compressed=excluded.compressed, updated_at=excluded.updated_at
+                    """, (olympiad_id, participant_uuid, task_id, value, compressed, now))
+                    c.execute("""
+                        INSERT INTO olympiad_code_history (olympiad_id, participant_uuid, task_id, language, code, compressed, submitted_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (olympiad_id, participant_uuid, task_id, language, value, compressed, now))
+                    journal_id = None
+                    if queue_item is not None:
+                        c.execute("""
+                            INSERT INTO submission_queue (olympiad_id, participant_uuid, task_id, language, code, scoring_mode, first_attempt, enqueued_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """, (olympiad_id, participant_uuid, task_id, queue_item['language'], queue_item['code'],
+                              queue_item['scoring_mode'], bool(queue_item.get('first_attempt')), time.time()))
+                        journal_id = c.lastrowid
                     conn.commit()
-                    return True
+                    return journal_id
             except Exception as e:
-                print(f"CRITICAL DB ERROR: {e}")
-                return False
+                print(f"CRITICAL DB ERROR (update_submission_immediate): {e}")
+                return None
+
+    def get_code_history(self, olympiad_id, participant_uuid, task_id=None):
+        """Все отправленные решения участника (новые первыми)."""
+        query = """
+            SELECT id, task_id, language, code, compressed, submitted_at
+            FROM olympiad_code_history
+            WHERE olympiad_id = ? AND participant_uuid = ?
+        """
+        params = [olympiad_id, participant_uuid]
+        if task_id is not None:
+            query += " AND task_id = ?"
+            params.append(task_id)
+        query += " ORDER BY id DESC"
+        with self._get_conn() as conn:
+            return [{
+                'id': r['id'],
+                'task_id': r['task_id'],
+                'language': r['language'],
+                'code': _unpack_code(r['code'], r['compressed']),
+                'submitted_at': r['submitted_at']
+            } for r in conn.execute(query, params)]
+
+    # === ЖУРНАЛ ОЧЕРЕДИ ПРОВЕРКИ ===
+    def get_queued_submissions(self):
+        """Все непроверенные посылки в порядке постановки в очередь."""
+        with self._get_conn() as conn:
+            return conn.execute("SELECT * FROM submission_queue ORDER BY id").fetchall()
+
+    def dequeue_submission(self, journal_id):
+        with self.write_lock:
+            try:
+                with self._get_conn() as conn:
+                    conn.execute("DELETE FROM submission_queue WHERE id = ?", (journal_id,))
+                    conn.commit()
+            except Exception as e:
+                print(f"DB Error (dequeue_submission): {e}")
+
     # [FIX] Добавляем поиск UUID по никнейму для восстановления сессии
     def get_participant_uuid_by_nickname(self, olympiad_id, nickname):
         with self._get_conn() as conn:
@@ -797,50 +1772,305 @@ class DBManager:
             row = c.fetchone()
             return row['participant_uuid'] if row else None
 
-# Скрипт запуска (Mono C# версия)
-def _run_batch(code, test_data_list, language, judge_script_filename, docker_image, checker_code=None):
-    judge_script = load_judge_script(judge_script_filename)
-    if not judge_script: return None, "System Error: Judge script not found"
+def _write_job_files(target_dir, code, language, judge_script, checker_code, options=None,
+                     artifact=None):
+    code_filename = "Program.cs" if language == "C#" else ("source.cpp" if language == "C++" else "script.py")
+    with open(os.path.join(target_dir, code_filename), "w", encoding="utf-8") as f: f.write(code)
+    with open(os.path.join(target_dir, "judge.py"), "w", encoding="utf-8") as f: f.write(judge_script)
+    # Общие функции раннеров - раннеры импортируют их без запасного варианта
+    with open(os.path.join(target_dir, "judge_utils.py"), "w", encoding="utf-8") as f:
+        f.write(load_judge_script("judge_utils.py"))
+    if options:
+        with open(os.path.join(target_dir, "judge_options.json"), "w", encoding="utf-8") as f: json.dump(options, f)
+    if checker_code:
+        with open(os.path.join(target_dir, "checker.py"), "w", encoding="utf-8") as f: f.write(checker_code)
+    if artifact is not None:
+        with open(os.path.join(target_dir, CACHED_ARTIFACT_FILENAME), "wb") as f: f.write(artifact)
+
+def _parse_judge_line(line):
+    """Одна строка протокола раннера: dict (тест / итог), list (итог целиком) или None."""
+    try:
+        return json.loads(line)
+    except (json.JSONDecodeError, ValueError, UnicodeDecodeError):
+        return None
+
+def _parse_judge_output(result):
+    """
+    Протокол раннера - JSON по строке: результат каждого теста по мере готовности,
+    затем {"done": true, "count": N} (вердикт - первые N тестов по порядку).
+    Ошибка до запуска тестов (компиляция) приходит одной строкой-списком.
+    Строка {"artifact": ...} (бинарник для кэша компиляции) - не результат теста.
+    """
+    output = result.stdout.decode('utf-8', errors='replace')
+    err = result.stderr.decode('utf-8', errors='replace')
+
+    if err and "System Error" in err: return None, f"Docker/Judge Error: {err}"
+
+    records = []
+    done = None
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = _parse_judge_line(line)
+        if isinstance(record, list):
+            return record, None
+        if not isinstance(record, dict):
+            out_preview = line[:200] + ("..." if len(line) > 200 else "")
+            return None, f"System Error (JSON parse failed) | Output: {out_preview}"
+        if "artifact" in record:
+            continue
+        if record.get("done"):
+            done = record
+        else:
+            records.append(record)
+
+    if done is None:
+        # Раннер не дошел до конца (убит, упал) - неполный результат не засчитываем
+        out_preview = output[-200:] if len(output) > 200 else output
+        return None, f"System Error (runner stopped after {len(records)} tests) | Output: {out_preview}"
+    # При параллельном прогоне тесты завершаются не по порядку
+    records.sort(key=lambda r: r.get("test_num", 0))
+    return records[:int(done.get("count", len(records)))], None
 
+def _run_judge_process(command, timeout, on_progress=None):
+    """
+    Запуск судьи с построчным чтением stdout: on_progress(record) вызывается
+    на каждый готовый тест, не дожидаясь конца проверки.
+    stderr пишется во временный файл, поэтому заполненный pipe stderr не остановит раннер.
+    Возвращает CompletedProcess, как subprocess.run; по таймауту - TimeoutExpired.
+    """
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=err_file)
+        expired = Event()
+
+        def kill():
+            expired.set()
+            proc.kill()
+
+        timer = Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+        lines = []
+        try:
+            for line in proc.stdout:
+                lines.append(line)
+                if on_progress is None:
+                    continue
+                record = _parse_judge_line(line)
+                if isinstance(record, dict) and "test_num" in record:
+                    try:
+                        on_progress(record)
+                    except Exception as e:
+                        print(f"JUDGE: Ошибка обработчика прогресса: {e}")
+            proc.wait()
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+        if expired.is_set():
+            raise subprocess.TimeoutExpired(command, timeout)
+        err_file.seek(0)
+        stderr = err_file.read()
+    return subprocess.CompletedProcess(command, proc.returncode, b"".join(lines), stderr)
+
+# Признаки сбоя на стороне сервера (OOM-killer, лимиты контейнера), а не ошибки в коде:
+# такие "ошибки компиляции" не кэшируются
+_TRANSIENT_COMPILE_ERRORS = (
+    "killed signal", "out of memory", "cannot allocate memory", "memory exhausted",
+    "std::bad_alloc", "resource temporarily unavailable", "cannot fork", "too many open files",
+    "no space left on device", "file size limit exceeded", "timed out",
+)
+
+def _is_cacheable_compile_error(verdict):
+    """Ошибку компиляции кэшируем, только если компилятор сам вернул ненулевой код."""
+    exit_code = verdict.get('exit_code')
+    # Отрицательный код - компилятор убит сигналом; нет кода - таймаут или старый раннер
+    if not isinstance(exit_code, int) or exit_code <= 0:
+        return False
+    error = (verdict.get('error') or '').lower()
+    return not any(marker in error for marker in _TRANSIENT_COMPILE_ERRORS)
+
+def _update_compile_cache(cache_key, result, verdicts):
+    """Сохраняет в кэш ошибку компиляции или бинарник, присланный раннером в stdout."""
+    if verdicts and len(verdicts) == 1 and verdicts[0].get('verdict') == "Compilation Error":
+        # Таймаут, OOM и лимиты контейнера зависят от нагрузки на сервер - такое не кэшируем
+        if _is_cacheable_compile_error(verdicts[0]):
+            compile_cache.put_error(cache_key, verdicts[0].get('error', ''))
+        return
+    # Только первая строка stdout: раннер пишет ее до запуска кода участника, поэтому
+    # строку {"artifact"}, подделанную программой, дальше по выводу не принимаем
+    record = _parse_judge_line(result.stdout.split(b"\n", 1)[0])
+    artifact = record.get("artifact") if isinstance(record, dict) else None
+    if not isinstance(artifact, dict):
+        return
+    try:
+        data = base64.b64decode(artifact.get("data", ""), validate=True)
+    except (ValueError, TypeError):
+        return
+    if hashlib.sha256(data).hexdigest() == artifact.get("sha256"):
+        compile_cache.put_binary(cache_key, data)
+
+def _finish_job(result, cache_key=None):
+    verdicts, err = _parse_judge_output(result)
+    if cache_key and not err:
+        _update_compile_cache(cache_key, result, verdicts)
+    return verdicts, err
+
+def _docker_args_for_workers(workers):
+    """
+    DOCKER_COMMON_ARGS с лимитами CPU/памяти/процессов, увеличенными под N параллельных тестов,
+    чтобы параллельный прогон не давал ложных TLE/MLE из-за конкуренции внутри контейнера.
+    ulimit -d ограничивает каждый тест отдельно, но не их сумму, поэтому контейнер
+    получает MEMORY_LIMIT_MB на каждый одновременный тест плюс запас.
+    """
+    if workers <= 1:
+        return list(DOCKER_COMMON_ARGS)
+    args = []
+    for arg in DOCKER_COMMON_ARGS:
+        if arg.startswith("--cpus="):
+            arg = f"--cpus={workers + 0.5}"
+        elif arg.startswith("--memory=") or arg.startswith("--memory-swap="):
+            arg = f"{arg.split('=')[0]}={workers * MEMORY_LIMIT_MB + CONTAINER_MEMORY_OVERHEAD_MB}m"
+        elif arg.startswith("--pids-limit="):
+            arg = f"--pids-limit={128 * workers}"
+        args.append(arg)
+    return args
+
+def _link_test_set(test_set_dir, slot_dir):
+    """
+    Подкладывает набор тестов в папку слота жесткими ссылками (без копирования).
+    False - ссылки не создаются (другая ФС и т.п.), нужен холодный запуск.
+    """
+    target = os.path.join(slot_dir, SLOT_TESTS_DIR)
+    try:
+        os.mkdir(target)
+        for name in os.listdir(test_set_dir):
+            os.link(os.path.join(test_set_dir, name), os.path.join(target, name))
+        return True
+    except OSError as e:
+        print(f"POOL: Не удалось подложить набор тестов в слот, холодный запуск: {e}")
+        shutil.rmtree(target, ignore_errors=True)
+        return False
+
+def _run_in_pool(container, code, language, judge_script, checker_code, timeout, options=None,
+                 artifact=None, on_progress=None):
+    """
+    Запуск судьи в тёплом контейнере.
+    Возвращает (result, None) или (None, причина), если контейнер неисправен
+    и нужно откатиться на холодный запуск.
+    """
+    _write_job_files(container.slot_dir, code, language, judge_script, checker_code, options, artifact)
+    command = ["docker", "exec", "-u", "appuser", "-w", "/home/appuser/run",
+               container.container_id, "python3", "/home/appuser/run/judge.py"]
+    result = _run_judge_process(command, timeout, on_progress)
+    # 125-127: ошибка самого docker exec (контейнер умер/удален), а не решения
+    if result.returncode in (125, 126, 127) and not result.stdout.strip():
+        return None, result.stderr.decode('utf-8', errors='replace')
+    return result, None
+
+def _run_in_sandbox(code, language, judge_script, docker_image, checker_code, workers, timeout, options,
+                    artifact, cache_key, test_set_dir, on_progress=None):
+    # 1. Тёплый контейнер из пула (лимиты пула рассчитаны на один тест за раз,
+    #    поэтому параллельный прогон всегда идет в отдельном контейнере)
+    container = container_pool.acquire(docker_image) if workers == 1 else None
+    if container and not _link_test_set(test_set_dir, container.slot_dir):
+        container_pool.release_async(container)
+        container = None
+    if container:
+        healthy = False
+        try:
+            # Контейнеру виден только набор этой посылки - в папке слота
+            pool_options = dict(options, tests_dir=f"/home/appuser/run/{SLOT_TESTS_DIR}")
+            result, pool_err = _run_in_pool(container, code, language, judge_script, checker_code,
+                                            timeout, pool_options, artifact, on_progress)
+            if result is not None:
+                healthy = True
+                return _finish_job(result, cache_key)
+            print(f"POOL: Контейнер {container.container_id[:12]} неисправен, холодный запуск: {pool_err.strip()}")
+        except subprocess.TimeoutExpired:
+            # Процессы внутри могли остаться живыми - контейнер будет пересоздан
+            return None, "Time Limit Exceeded (Overall)"
+        except Exception as e:
+            print(f"POOL: Ошибка запуска в пуле, холодный запуск: {e}")
+        finally:
+            container_pool.release_async(container, healthy=healthy)
+
+    # 2. Холодный запуск (пул выключен или недоступен)
     tmp_dir = None
     try:
         tmp_dir = tempfile.mkdtemp()
-        code_filename = "Program.cs" if language == "C#" else ("source.cpp" if language == "C++" else "script.py")
-        
-        with open(os.path.join(tmp_dir, code_filename), "w", encoding="utf-8") as f: f.write(code)
-        with open(os.path.join(tmp_dir, "judge.py"), "w", encoding="utf-8") as f: f.write(judge_script)
-        with open(os.path.join(tmp_dir, "tests.json"), "w", encoding="utf-8") as f: json.dump(test_data_list, f)
-        if checker_code:
-            with open(os.path.join(tmp_dir, "checker.py"), "w", encoding="utf-8") as f: f.write(checker_code)
+        _write_job_files(tmp_dir, code, language, judge_script, checker_code,
+                         dict(options, tests_dir=TESTS_MOUNT), artifact)
             
         abs_path = os.path.abspath(tmp_dir)
-        docker_volume_arg = ["-v", f"{_get_docker_path(abs_path)}:/home/appuser/run:ro"]
-        total_time_limit = sum(float(t.get('limit', 1.0)) for t in test_data_list)
+        docker_volume_arg = ["-v", f"{_get_docker_path(abs_path)}:/home/appuser/run:ro",
+                             "-v", f"{_get_docker_path(os.path.abspath(test_set_dir))}:{TESTS_MOUNT}:ro"]
         
         container_command = ["python3", "/home/appuser/run/judge.py"]
-        command = DOCKER_COMMON_ARGS + docker_volume_arg + [docker_image] + container_command
-
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=total_time_limit + 15.0)
-        output = result.stdout.decode('utf-8', errors='replace')
-        err = result.stderr.decode('utf-8', errors='replace')
-
-        if err and "System Error" in err: return None, f"Docker/Judge Error: {err}"
+        command = _docker_args_for_workers(workers) + docker_volume_arg + [docker_image] + container_command
 
-        try:
-            return json.loads(output), None
-        except (json.JSONDecodeError, ValueError) as e:
-            err_preview = str(e)[:100] + ("..." if len(str(e)) > 100 else "")
-            out_preview = output[:200] + ("..." if len(output) > 200 else "")
-            return None, f"System Error (JSON parse failed): {err_preview} | Output: {out_preview}"
+        result = _run_judge_process(command, timeout, on_progress)
+        return _finish_job(result, cache_key)
 
     except subprocess.TimeoutExpired: return None, "Time Limit Exceeded (Overall)"
     except Exception as e: return None, f"Execution error: {str(e)}"
     finally:
         if tmp_dir and os.path.exists(tmp_dir): shutil.rmtree(tmp_dir)
 
-def run_python(code, test_data_list, checker_code=None):
-    return _run_batch(code, test_data_list, "Python", "py_runner.py", DOCKER_IMAGE_PYTHON, checker_code)
-def run_cpp(code, test_data_list, checker_code=None):
-    return _run_batch(code, test_data_list, "C++", "cpp_runner.py", DOCKER_IMAGE_CPP, checker_code)
-def run_csharp(code, test_data_list, checker_code=None):
-    return _run_batch(code, test_data_list, "C#", "cs_runner.py", DOCKER_IMAGE_CSHARP, checker_code)
\ No newline at end of file
+# Скрипт запуска (Mono C# версия)
+def _run_batch(code, test_data_list, language, judge_script_filename, docker_image, checker_code=None, workers=1,
+               stop_on_failure=False, test_set_id=None, on_progress=None):
+    """
+    Проверка решения в песочнице. Возвращает (verdicts, global_err).
+    on_progress(record) - вызывается с результатом каждого теста по мере прогона.
+    """
+    judge_script = load_judge_script(judge_script_filename)
+    if not judge_script: return None, "System Error: Judge script not found"
+
+    total_time_limit = sum(float(t.get('limit', 1.0)) for t in test_data_list)
+    timeout = total_time_limit + 15.0
+    workers = max(1, min(int(workers or 1), len(test_data_list)))
+    options = {'output_limit': OUTPUT_LIMIT_BYTES, 'memory_limit': MEMORY_LIMIT_MB * 1024 * 1024}
+    if workers > 1: options['workers'] = workers
+    if stop_on_failure: options['stop_on_failure'] = True
+
+    # Кэш компиляции: ошибку отдаем сразу, бинарник подкладываем раннеру
+    cache_key = None
+    artifact = None
+    if language in COMPILED_LANGUAGES and compile_cache.enabled:
+        cache_key = compile_cache.make_key(docker_image, judge_script, code)
+        cached = compile_cache.get(cache_key)
+        if cached and cached[0] == 'error':
+            return [{"verdict": "Compilation Error", "error": cached[1]}], None
+        if cached:
+            artifact = cached[1]
+            options['cached_artifact'] = CACHED_ARTIFACT_FILENAME
+            cache_key = None
+        elif cache_key:
+            options['export_artifact'] = True
+
+    # Общий read-only набор тестов (пишется на диск только для новой версии тестов)
+    try:
+        test_set_id, test_set_dir = test_set_store.acquire(test_data_list, test_set_id)
+    except OSError as e:
+        return None, f"System Error: Failed to prepare tests: {e}"
+    try:
+        return _run_in_sandbox(code, language, judge_script, docker_image, checker_code, workers, timeout, options,
+                               artifact, cache_key, test_set_dir, on_progress)
+    finally:
+        test_set_store.release(test_set_id)
+
+def run_python(code, test_data_list, checker_code=None, workers=1, stop_on_failure=False, test_set_id=None,
+               on_progress=None):
+    return _run_batch(code, test_data_list, "Python", "py_runner.py", DOCKER_IMAGE_PYTHON, checker_code, workers, stop_on_failure,
+                      test_set_id, on_progress)
+def run_cpp(code, test_data_list, checker_code=None, workers=1, stop_on_failure=False, test_set_id=None,
+            on_progress=None):
+    return _run_batch(code, test_data_list, "C++", "cpp_runner.py", DOCKER_IMAGE_CPP, checker_code, workers, stop_on_failure,
+                      test_set_id, on_progress)
+def run_csharp(code, test_data_list, checker_code=None, workers=1, stop_on_failure=False, test_set_id=None,
+               on_progress=None):
+    return _run_batch(code, test_data_list, "C#", "cs_runner.py", DOCKER_IMAGE_CSHARP, checker_code, workers, stop_on_failure,
+                      test_set_id, on_progress)
@@ -3,23 +3,11 @@ import os
 import json
 import subprocess
 import time
-import io
-from contextlib import redirect_stdout
 
-# Import shared utilities
-try:
-    from judge_utils import get_tokens, compare_outputs, check_verdict_with_checker
-    HAS_JUDGE_UTILS = True
-except ImportError:
-    HAS_JUDGE_UTILS = False
-    # Fallback implementation if judge_utils is not available
-    def get_tokens(text):
-        if not text:
-            return []
-        return text.strip().split()
-    
-    def compare_outputs(user_output, expected_output):
-        return get_tokens(user_output) == get_tokens(expected_output)
+# Shared utilities (judge_utils.py is always copied next to the runner)
+from judge_utils import (check_verdict_with_checker, load_judge_options, load_tests,
+                         read_test_file, run_tests, run_limited, emit_result, emit_done,
+                         restore_artifact, export_artifact)
 
 try:
     import checker
@@ -28,36 +16,49 @@ except ImportError:
     HAS_CHECKER = False
 
 def run_judge():
-    results = []
+    options = load_judge_options()
     
     # 1. Компиляция
     # Важно: пишем output в /tmp/a.out, т.к. текущая директория Read-Only
-    try:
-        compile_proc = subprocess.run(
-            ['g++', 'source.cpp', '-o', '/tmp/a.out', '-O3', '-march=native', '-std=c++17'],
-            capture_output=True, text=True, timeout=15
-        )
-    except subprocess.TimeoutExpired:
-        print(json.dumps([{"verdict": "Compilation Error", "error": "Compilation timed out (> 15s)"}]))
-        return
+    # Если хост нашел бинарник в кэше компиляции - просто восстанавливаем его
+    cached_artifact = options.get('cached_artifact')
+    if not (cached_artifact and restore_artifact(cached_artifact, '/tmp/a.out')):
+        try:
+            compile_proc = subprocess.run(
+                ['g++', 'source.cpp', '-o', '/tmp/a.out', '-O3', '-march=native', '-std=c++17'],
+                capture_output=True, text=True, timeout=15
+            )
+        except subprocess.TimeoutExpired:
+            print(json.dumps([{"verdict": "Compilation Error", "error": "Compilation timed out (> 15s)"}]))
+            return
 
-    if compile_proc.returncode != 0:
-        error_msg = compile_proc.stderr.replace("source.cpp:", "line ")
-        print(json.dumps([{"verdict": "Compilation Error", "error": error_msg}]))
-        return
+        if compile_proc.returncode != 0:
+            error_msg = compile_proc.stderr.replace("source.cpp:", "line ")
+            # exit_code: хост кэширует ошибку, только если компилятор завершился сам (не сигналом)
+            print(json.dumps([{"verdict": "Compilation Error", "error": error_msg,
+                               "exit_code": compile_proc.returncode}]))
+            return
+
+        if options.get('export_artifact'):
+            export_artifact('/tmp/a.out')
 
     # 2. Чтение тестов
     try:
-        with open('tests.json', 'r') as f:
-            tests = json.load(f)
+        tests = load_tests(options.get('tests_dir', 'tests'))
     except Exception as e:
-        print(json.dumps([{"verdict": "Internal Error", "error": f"Failed to read tests.json: {e}"}]))
+        print(json.dumps([{"verdict": "Internal Error", "error": f"Failed to read tests: {e}"}]))
         return
 
     # 3. Прогоняем тесты
-    for i, test in enumerate(tests):
-        test_input = test.get('input', '')
-        expected_output = test.get('output', '')
+    # Лимит вывода программы (байт stdout на тест), дальше - Output Limit Exceeded
+    output_limit = int(options.get('output_limit', 64 * 1024 * 1024))
+    # Лимит памяти на тест (байт), отдельно для каждого запуска программы
+    memory_limit = int(options.get('memory_limit', 512 * 1024 * 1024))
+    # Режимы сравнения без чекера: допуск для вещественных чисел, без учета регистра
+    compare_modes = {"float_tolerance": options.get('float_tolerance'),
+                     "case_sensitive": not options.get('case_insensitive', False)}
+
+    def judge_test(i, test):
         time_limit = float(test.get('limit', 1.0))
         cmd_timeout = time_limit
         
@@ -65,70 +66,73 @@ def run_judge():
             start_time = time.monotonic()
             
             # Запуск скомпилированного бинарника из /tmp
-            process = subprocess.run(
-                ['timeout', str(cmd_timeout), '/tmp/a.out'],
-                input=test_input.encode('utf-8'),
-                capture_output=True,
-                timeout=cmd_timeout + 0.5
-            )
+            # Вход подается прямо из файла теста, без чтения в память.
+            # Без чекера вывод сверяется с эталоном на лету и целиком не хранится
+            with open(test['input_path'], 'rb') as stdin_file:
+                process = run_limited(
+                    ['timeout', str(cmd_timeout), '/tmp/a.out'],
+                    stdin_file,
+                    timeout=cmd_timeout + 0.5,
+                    output_limit=output_limit,
+                    memory_limit=memory_limit,
+                    answer_path=None if HAS_CHECKER else test['answer_path'],
+                    **compare_modes
+                )
             
-            output = process.stdout.decode('utf-8', errors='replace')
-            error = process.stderr.decode('utf-8', errors='replace')
-            return_code = process.returncode
+            output = process["output"]
+            error = process["error"]
+            return_code = process["returncode"]
             
             verdict = ""
             
-            if return_code == 124:
+            if process["output_limit_exceeded"]:
+                verdict = "Output Limit Exceeded"
+            elif return_code == 124:
                 verdict = "Time Limit Exceeded"
             elif return_code != 0:
                 verdict = "Runtime Error"
             else:
                 if HAS_CHECKER:
-                    if HAS_JUDGE_UTILS:
-                        verdict, checker_error = check_verdict_with_checker(
-                            checker, test_input, output, expected_output
-                        )
-                        if checker_error:
-                            error += checker_error
-                    else:
-                        # Fallback to original implementation
-                        try:
-                            f_dummy = io.StringIO()
-                            with redirect_stdout(f_dummy):
-                                is_ok = checker.check(test_input, output, expected_output)
-                            verdict = "Accepted" if is_ok else "Wrong Answer"
-                        except Exception as check_err:
-                            verdict = "Judge Error"
-                            error += f"\nChecker failed: {check_err}"
+                    # Эталон и вход читаются с диска только для чекера
+                    expected_output = read_test_file(test['answer_path'])
+                    test_input = read_test_file(test['input_path'])
+                    verdict, checker_error = check_verdict_with_checker(
+                        checker, test_input, output, expected_output
+                    )
+                    if checker_error:
+                        error += checker_error
                 else:
-                    if compare_outputs(output, expected_output):
-                        verdict = "Accepted"
-                    else:
-                        verdict = "Wrong Answer"
+                    verdict = "Accepted" if process["matched"] else "Wrong Answer"
             
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": verdict,
-                "output": output,
+                "output": process["preview"],
                 "error": error
-            })
+            }
 
         except subprocess.TimeoutExpired:
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": "Time Limit Exceeded",
                 "output": "",
                 "error": "Judge subprocess timeout"
-            })
+            }
         except Exception as e:
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": "Internal Error",
                 "output": "",
                 "error": str(e)
-            })
+            }
+
+    # Параллельный прогон: бинарник собран один раз, тесты делятся между потоками
+    # stop_on_failure: для ICPC/all_or_nothing прекращаем после первого непройденного теста
+    results = run_tests(tests, judge_test, workers=int(options.get('workers', 1)),
+                        stop_on_failure=bool(options.get('stop_on_failure', False)),
+                        on_result=emit_result)
 
-    print(json.dumps(results))
+    emit_done(results)
 
 if __name__ == "__main__":
     run_judge()
\ No newline at end of file
@@ -3,20 +3,10 @@ import os
 import json
 import subprocess
 
-# Import shared utilities
-try:
-    from judge_utils import get_tokens, compare_outputs, check_verdict_with_checker
-    HAS_JUDGE_UTILS = True
-except ImportError:
-    HAS_JUDGE_UTILS = False
-    # Fallback implementation if judge_utils is not available
-    def get_tokens(text):
-        if not text:
-            return []
-        return text.strip().split()
-    
-    def compare_outputs(user_output, expected_output):
-        return get_tokens(user_output) == get_tokens(expected_output)
+# Shared utilities (judge_utils.py is always copied next to the runner)
+from judge_utils import (check_verdict_with_checker, load_judge_options, load_tests,
+                         read_test_file, run_tests, run_limited, emit_result, emit_done,
+                         restore_artifact, export_artifact)
 
 # [FIX] Добавляем поддержку кастомного чекера
 try:
@@ -26,7 +16,7 @@ except ImportError:
     HAS_CHECKER = False
 
 def run_judge():
-    results = []
+    options = load_judge_options()
     
     # 1. Настройка путей
     # Исходный код читаем из текущей папки (она Read-Only)
@@ -38,39 +28,51 @@ def run_judge():
     # -out:... указывает компилятору, куда сохранить файл
     compile_cmd = ["mcs", "-out:" + exe_file, source_file]
     
-    try:
-        compile_proc = subprocess.run(
-            compile_cmd,
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
-        
-        if compile_proc.returncode != 0:
-            # Ошибка компиляции
-            err_msg = compile_proc.stderr + "\n" + compile_proc.stdout
-            print(json.dumps([{"verdict": "Compilation Error", "error": err_msg.strip()}]))
+    # Если хост нашел сборку в кэше компиляции - пропускаем mcs
+    cached_artifact = options.get('cached_artifact')
+    if not (cached_artifact and restore_artifact(cached_artifact, exe_file)):
+        try:
+            compile_proc = subprocess.run(
+                compile_cmd,
+                capture_output=True,
+                text=True,
+                timeout=15
+            )
+            
+            if compile_proc.returncode != 0:
+                # Ошибка компиляции
+                err_msg = compile_proc.stderr + "\n" + compile_proc.stdout
+                # exit_code: хост кэширует ошибку, только если компилятор завершился сам (не сигналом)
+                print(json.dumps([{"verdict": "Compilation Error", "error": err_msg.strip(),
+                                   "exit_code": compile_proc.returncode}]))
+                return
+
+        except subprocess.TimeoutExpired:
+            print(json.dumps([{"verdict": "Compilation Error", "error": "Compilation timed out"}]))
+            return
+        except Exception as e:
+            print(json.dumps([{"verdict": "System Error", "error": f"Compiler launch failed: {e}"}]))
             return
 
-    except subprocess.TimeoutExpired:
-        print(json.dumps([{"verdict": "Compilation Error", "error": "Compilation timed out"}]))
-        return
-    except Exception as e:
-        print(json.dumps([{"verdict": "System Error", "error": f"Compiler launch failed: {e}"}]))
-        return
+        if options.get('export_artifact'):
+            export_artifact(exe_file)
 
     # === 3. ЗАПУСК ТЕСТОВ ===
     try:
-        with open('tests.json', 'r') as f:
-            tests = json.load(f)
+        tests = load_tests(options.get('tests_dir', 'tests'))
     except Exception as e:
         print(json.dumps([{"verdict": "Internal Error", "error": f"Tests read error: {e}"}]))
         return
 
-    for i, test in enumerate(tests):
-        test_input = test.get('input', '')
-        expected_output = test.get('output', '')
-        
+    # Лимит вывода программы (байт stdout на тест), дальше - Output Limit Exceeded
+    output_limit = int(options.get('output_limit', 64 * 1024 * 1024))
+    # Лимит памяти на тест (байт), отдельно для каждого запуска программы
+    memory_limit = int(options.get('memory_limit', 512 * 1024 * 1024))
+    # Режимы сравнения без чекера: допуск для вещественных чисел, без учета регистра
+    compare_modes = {"float_tolerance": options.get('float_tolerance'),
+                     "case_sensitive": not options.get('case_insensitive', False)}
+
+    def judge_test(i, test):
         try:
             time_limit = float(test.get('limit', 1.0))
         except (ValueError, TypeError):
@@ -83,70 +85,80 @@ def run_judge():
             # Запускаем скомпилированный файл из /tmp
             run_cmd = ['timeout', str(cmd_timeout), 'mono', exe_file]
             
-            process = subprocess.run(
-                run_cmd,
-                input=test_input.encode('utf-8'),
-                capture_output=True,
-                # [BEST PRACTICE] timeout чуть больше, чтобы успеть поймать код 124
-                timeout=cmd_timeout + 0.5 
-            )
+            # Вход подается прямо из файла теста, без чтения в память.
+            # Без чекера вывод сверяется с эталоном на лету и целиком не хранится
+            with open(test['input_path'], 'rb') as stdin_file:
+                process = run_limited(
+                    run_cmd,
+                    stdin_file,
+                    # [BEST PRACTICE] timeout чуть больше, чтобы успеть поймать код 124
+                    timeout=cmd_timeout + 0.5,
+                    output_limit=output_limit,
+                    memory_limit=memory_limit,
+                    answer_path=None if HAS_CHECKER else test['answer_path'],
+                    **compare_modes
+                )
             
-            output = process.stdout.decode('utf-8', errors='replace')
-            error = process.stderr.decode('utf-8', errors='replace')
+            output = process["output"]
+            error = process["error"]
             
             verdict = ""
-            if process.returncode == 124: # Linux timeout signal
+            if process["output_limit_exceeded"]:
+                verdict = "Output Limit Exceeded"
+            elif process["returncode"] == 124: # Linux timeout signal
                 verdict = "Time Limit Exceeded"
-            elif process.returncode != 0:
+            elif process["returncode"] != 0:
                 verdict = "Runtime Error"
             else:
                 # [FIX] Логика проверки ответа (Чекер или Стандарт)
                 if HAS_CHECKER:
-                    if HAS_JUDGE_UTILS:
-                        verdict, checker_error = check_verdict_with_checker(
-                            checker, test_input, output, expected_output
-                        )
-                        if checker_error:
-                            error += checker_error
-                    else:
-                        # Fallback to original implementation
-                        try:
-                            import io
-                            from contextlib import redirect_stdout
-                            
-                            f_dummy = io.StringIO()
-                            with redirect_stdout(f_dummy):
-                                is_ok = checker.check(test_input, output, expected_output)
-                            verdict = "Accepted" if is_ok else "Wrong Answer"
-                        except Exception as check_err:
-                            verdict = "Judge Error"
-                            error += f"\nChecker failed: {check_err}"
+                    # Эталон и вход читаются с диска только для чекера
+                    expected_output = read_test_file(test['answer_path'])
+                    test_input = read_test_file(test['input_path'])
+                    verdict, checker_error = check_verdict_with_checker(
+                        checker, test_input, output, expected_output
+                    )
+                    if checker_error:
+                        error += checker_error
                 else:
                     # Стандартное сравнение (игнорируя пробелы)
-                    if compare_outputs(output, expected_output):
-                        verdict = "Accepted"
-                    else:
-                        verdict = "Wrong Answer"
+                    verdict = "Accepted" if process["matched"] else "Wrong Answer"
             
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": verdict,
-                "output": output,
+                "output": process["preview"],
                 "error": error
-            })
+            }
             
         except subprocess.TimeoutExpired:
-            results.append({"test_num": i+1, "verdict": "Time Limit Exceeded", "error": "Timeout"})
+            return {
+                "test_num": i + 1,
+                "verdict": "Time Limit Exceeded",
+                "output": "",
+                "error": "Timeout"
+            }
         except Exception as e:
-            results.append({"test_num": i+1, "verdict": "Internal Error", "error": str(e)})
+            return {
+                "test_num": i + 1,
+                "verdict": "Internal Error",
+                "output": "",
+                "error": str(e)
+            }
+
+    # Параллельный прогон: бинарник собран один раз, тесты делятся между потоками
+    # stop_on_failure: для ICPC/all_or_nothing прекращаем после первого непройденного теста
+    results = run_tests(tests, judge_test, workers=int(options.get('workers', 1)),
+                        stop_on_failure=bool(options.get('stop_on_failure', False)),
+                        on_result=emit_result)
 
     # Уборка временного файла
     if os.path.exists(exe_file):
         try: os.remove(exe_file)
         except: pass
 
-    # Вывод результатов для сервера
-    print(json.dumps(results))
+    # Результаты тестов уже отправлены построчно, сообщаем серверу итог
+    emit_done(results)
 
 if __name__ == "__main__":
     run_judge()
\ No newline at end of file
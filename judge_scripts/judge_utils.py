@@ -3,9 +3,353 @@ Shared utilities for judge runner scripts.
 This module consolidates common logic used by py_runner, cpp_runner, and cs_runner.
 """
 
+import base64
+import hashlib
 import io
+import itertools
+import json
+import mmap
+import os
+import re
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
 
+# redirect_stdout подменяет sys.stdout глобально, поэтому при параллельном
+# прогоне тестов вызовы чекера должны идти по одному.
+_checker_lock = threading.Lock()
+
+# Результаты пишутся в настоящий stdout, даже если в этот момент чекер подменил sys.stdout
+_result_stream = sys.stdout
+_emit_lock = threading.Lock()
+
+
+def load_judge_options(path="judge_options.json"):
+    """
+    Read optional judge options written by the host next to judge.py.
+    
+    Returns:
+        Dict of options (e.g. {"workers": 4}), empty dict if file is missing
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_tests(tests_dir="tests"):
+    """
+    Read the test manifest of a test set (manifest.json).
+    The host mounts the shared test set read-only and passes its path
+    as the "tests_dir" judge option. Test data stays on disk: entries
+    only point to the input/answer files, which are opened one test at a time.
+    
+    Returns:
+        List of dicts {"input_path", "answer_path", "limit"} in test order
+    """
+    with open(os.path.join(tests_dir, "manifest.json"), 'r') as f:
+        manifest = json.load(f)
+    return [
+        {
+            "input_path": os.path.join(tests_dir, t["input"]),
+            "answer_path": os.path.join(tests_dir, t["answer"]),
+            "limit": t.get("limit", 1.0)
+        } for t in manifest["tests"]
+    ]
+
+
+def read_test_file(path):
+    """Read one test input/answer file as text (only when the test needs it)."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+# Вывод программы участника читается порциями с лимитом: stdout сверх лимита -
+# Output Limit Exceeded, хосту уходит только начало вывода, лишний stderr отбрасывается
+DEFAULT_OUTPUT_LIMIT = 64 * 1024 * 1024
+OUTPUT_PREVIEW_BYTES = 64 * 1024
+STDERR_LIMIT_BYTES = 64 * 1024
+_READ_CHUNK = 64 * 1024
+# Лимит памяти на один тест: контейнер общий для параллельных тестов,
+# поэтому каждый запуск ограничивается отдельно
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024
+
+
+class TokenMatcher:
+    """
+    Streaming whitespace-token comparison of program output with an answer file.
+    Output is fed in chunks as it is read (a token cut between chunks is carried
+    over); the answer file is memory-mapped and tokenized block by block.
+    Neither side is kept in memory whole. Modes are the same as in compare_outputs.
+    """
+
+    def __init__(self, answer_path, float_tolerance=None, case_sensitive=True):
+        self._file = open(answer_path, 'rb')
+        try:
+            self._answer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл нельзя отобразить в память
+            self._answer = b""
+        self._expected = itertools.chain.from_iterable(_token_blocks(self._answer, not case_sensitive))
+        self._float_tolerance = float_tolerance
+        self._lower = not case_sensitive
+        self._partial = b""
+        self.ok = True
+
+    def feed(self, chunk):
+        if not self.ok:
+            return
+        data = self._partial + chunk
+        if self._lower:
+            data = data.lower()
+        tokens = data.split()
+        if tokens and not data[-1:].isspace():
+            self._partial = tokens.pop()
+        else:
+            self._partial = b""
+        self.ok = _match_tokens(tokens, self._expected, self._float_tolerance)
+
+    def finish(self):
+        """True if the whole output matched the whole answer."""
+        if self.ok and self._partial:
+            self.ok = _match_tokens([self._partial], self._expected, self._float_tolerance)
+        if self.ok and next(self._expected, None) is not None:
+            self.ok = False
+        self.close()
+        return self.ok
+
+    def close(self):
+        self._expected = None
+        if isinstance(self._answer, mmap.mmap):
+            self._answer.close()
+        self._file.close()
+
+
+def _kill_process_tree(proc):
+    # timeout делает себя лидером группы процессов - убиваем ее целиком вместе с программой
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        proc.kill()
+
+
+def _with_memory_limit(cmd, memory_limit):
+    # ulimit -d (RLIMIT_DATA) считает кучу и анонимные mmap, но не зарезервированное
+    # адресное пространство - в отличие от RLIMIT_AS не ломает Mono и Python.
+    # Через sh, а не preexec_fn: тесты запускаются из нескольких потоков
+    return ["sh", "-c", f'ulimit -d {memory_limit // 1024} && exec "$@"', "sh"] + list(cmd)
+
+
+def run_limited(cmd, stdin_file, timeout, output_limit=DEFAULT_OUTPUT_LIMIT, answer_path=None,
+                float_tolerance=None, case_sensitive=True, memory_limit=None):
+    """
+    Run the user's program with bounded capture of stdout/stderr.
+    
+    stdout is read in chunks. With answer_path it is compared with the answer
+    on the fly (TokenMatcher, with the float_tolerance / case_sensitive modes
+    of compare_outputs) and only the first OUTPUT_PREVIEW_BYTES are kept;
+    without it (custom checker) the full output up to output_limit is kept.
+    Past output_limit bytes the program is killed. stderr keeps its first
+    STDERR_LIMIT_BYTES, the rest is read and dropped. With memory_limit the
+    program gets its own data segment limit (bytes), so one test cannot use
+    the memory of the others running in the same container.
+    
+    Returns:
+        Dict with returncode, output (full or preview text), preview (text for
+        the report, truncated), error, output_limit_exceeded and matched
+        (True/False with answer_path, otherwise None)
+        
+    Raises:
+        subprocess.TimeoutExpired after timeout seconds, like subprocess.run
+    """
+    matcher = TokenMatcher(answer_path, float_tolerance, case_sensitive) if answer_path else None
+    if memory_limit:
+        cmd = _with_memory_limit(cmd, memory_limit)
+    proc = subprocess.Popen(cmd, stdin=stdin_file, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=True)
+    deadline = time.monotonic() + timeout
+    stdout_size = 0
+    kept = bytearray()
+    stderr_buf = bytearray()
+    exceeded = False
+    matched = None
+    selector = selectors.DefaultSelector()
+    selector.register(proc.stdout, selectors.EVENT_READ, "out")
+    selector.register(proc.stderr, selectors.EVENT_READ, "err")
+    try:
+        while selector.get_map() and not exceeded:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, _READ_CHUNK)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                if key.data == "err":
+                    if len(stderr_buf) < STDERR_LIMIT_BYTES:
+                        stderr_buf += chunk[:STDERR_LIMIT_BYTES - len(stderr_buf)]
+                    continue
+                stdout_size += len(chunk)
+                if stdout_size > output_limit:
+                    exceeded = True
+                    _kill_process_tree(proc)
+                    break
+                if matcher:
+                    matcher.feed(chunk)
+                    if len(kept) < OUTPUT_PREVIEW_BYTES:
+                        kept += chunk[:OUTPUT_PREVIEW_BYTES - len(kept)]
+                else:
+                    kept += chunk
+        proc.wait(max(0.0, deadline - time.monotonic()))
+        if matcher and not exceeded and proc.returncode == 0:
+            matched = matcher.finish()
+    finally:
+        selector.close()
+        if proc.poll() is None:
+            _kill_process_tree(proc)
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+        if matcher:
+            matcher.close()
+
+    output = kept.decode('utf-8', errors='replace')
+    preview = kept[:OUTPUT_PREVIEW_BYTES].decode('utf-8', errors='replace')
+    if exceeded or stdout_size > OUTPUT_PREVIEW_BYTES:
+        preview += "\n... (output truncated)"
+    return {
+        "returncode": proc.returncode,
+        "output": output,
+        "preview": preview,
+        "error": stderr_buf.decode('utf-8', errors='replace'),
+        "output_limit_exceeded": exceeded,
+        "matched": matched
+    }
+
+
+# Собранный бинарник передается хосту для кэша компиляции первой строкой stdout,
+# до любого теста: хост принимает его только с этой позиции
+MAX_EXPORT_ARTIFACT_BYTES = 8 * 1024 * 1024
+
+
+def restore_artifact(cached_path, target_path):
+    """
+    Put a cached compiled artifact (provided by the host) where the compiler would write it.
+    
+    Returns:
+        True if the artifact was restored and compilation can be skipped
+    """
+    try:
+        shutil.copyfile(cached_path, target_path)
+        os.chmod(target_path, 0o755)
+        return True
+    except OSError:
+        return False
+
+
+def export_artifact(path):
+    """
+    Send the freshly compiled artifact to the host as the first stdout line
+    ({"artifact": {"sha256", "data" (base64)}}). Called right after compilation,
+    before any user code runs. The line is written even when the artifact is
+    not exported ({"artifact": null}, too big or unreadable), so a line forged
+    by the user's program can never take the first position.
+    """
+    artifact = None
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(MAX_EXPORT_ARTIFACT_BYTES + 1)
+        if len(data) <= MAX_EXPORT_ARTIFACT_BYTES:
+            artifact = {"sha256": hashlib.sha256(data).hexdigest(),
+                        "data": base64.b64encode(data).decode('ascii')}
+    except OSError:
+        pass
+    emit_result({"artifact": artifact})
+
+
+def emit_result(result):
+    """
+    Send one test result to the host right away: one JSON object per line,
+    so the host can report progress before all tests are finished.
+    """
+    line = json.dumps(result)
+    with _emit_lock:
+        _result_stream.write(line + "\n")
+        _result_stream.flush()
+
+
+def emit_done(results):
+    """
+    Final line of the protocol: how many results (in test order) form the verdict.
+    With stop_on_failure, tests emitted after the first failure are not counted.
+    """
+    emit_result({"done": True, "count": len(results)})
+
+
+def run_tests(tests, judge_test, workers=1, stop_on_failure=False, on_result=None):
+    """
+    Run judge_test(index, test) for every test, optionally in parallel.
+    The compiled artifact is shared; results are returned in test order.
+    
+    Args:
+        tests: List of test entries from load_tests()
+        judge_test: Callable (index, test) -> result dict
+        workers: Number of tests executed simultaneously
+        stop_on_failure: Stop after the first non-Accepted verdict
+            (ICPC / all_or_nothing only need to know whether everything passed)
+        on_result: Optional callable(result) invoked as soon as a test finishes
+        
+    Returns:
+        List of result dicts in test order, cut after the first failure
+        when stop_on_failure is set
+    """
+    if workers <= 1 or len(tests) <= 1:
+        results = []
+        for i, test in enumerate(tests):
+            result = judge_test(i, test)
+            if on_result:
+                on_result(result)
+            results.append(result)
+            if stop_on_failure and result.get("verdict") != "Accepted":
+                break
+        return results
+
+    failed = threading.Event()
+
+    def guarded(i, test):
+        # Тесты, которые еще не начались к моменту первой ошибки, пропускаем
+        if stop_on_failure and failed.is_set():
+            return None
+        result = judge_test(i, test)
+        if on_result:
+            on_result(result)
+        if stop_on_failure and result.get("verdict") != "Accepted":
+            failed.set()
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(guarded, range(len(tests)), tests))
+
+    if not stop_on_failure:
+        return results
+    # Потоки берут тесты по порядку, поэтому все тесты до первой ошибки выполнены
+    ordered = []
+    for result in results:
+        if result is None:
+            break
+        ordered.append(result)
+        if result.get("verdict") != "Accepted":
+            break
+    return ordered
+
 
 def get_tokens(text):
     """
@@ -23,20 +367,109 @@ def get_tokens(text):
     return text.strip().split()
 
 
-def compare_outputs(user_output, expected_output):
+# Сравнение вывода идет по байтам блоками ~64 КБ, выровненными по пробельному символу:
+# split() и сравнение списков блока работают на C, а в памяти одновременно
+# только токены одного блока, а не миллионы строк всего ответа
+_COMPARE_BLOCK = 64 * 1024
+_SPACE = re.compile(rb"\s")
+
+
+def _as_bytes(data):
+    if not data:
+        return b""
+    if isinstance(data, str):
+        return data.encode('utf-8', errors='replace')
+    return data
+
+
+def _content_bounds(buf):
+    """(start, end) of buf without leading/trailing whitespace, without copying it."""
+    start = 0
+    end = len(buf)
+    while start < end and buf[start:start + 1].isspace():
+        start += 1
+    while end > start and buf[end - 1:end].isspace():
+        end -= 1
+    return start, end
+
+
+def _same_content(user, expected):
+    """Texts equal up to surrounding whitespace: one memcmp, no copies."""
+    user_start, user_end = _content_bounds(user)
+    expected_start, expected_end = _content_bounds(expected)
+    if user_end - user_start != expected_end - expected_start:
+        return False
+    return user.startswith(memoryview(expected)[expected_start:expected_end], user_start)
+
+
+def _token_blocks(buf, lower=False, block=_COMPARE_BLOCK):
+    """Yield lists of whitespace-separated byte tokens, one block of buf at a time."""
+    pos = 0
+    size = len(buf)
+    while pos < size:
+        end = pos + block
+        if end < size:
+            # Не режем токен: граница блока сдвигается до ближайшего пробельного символа
+            space = _SPACE.search(buf, end)
+            end = space.start() if space else size
+        else:
+            end = size
+        part = buf[pos:end]
+        yield part.lower().split() if lower else part.split()
+        pos = end
+
+
+def _tokens_close(user_token, expected_token, float_tolerance):
+    """Tokens differ as bytes; equal only if both are numbers within the tolerance."""
+    try:
+        user_value = float(user_token)
+        expected_value = float(expected_token)
+    except ValueError:
+        return False
+    return abs(user_value - expected_value) <= float_tolerance * max(1.0, abs(expected_value))
+
+
+def _match_tokens(tokens, expected_iter, float_tolerance=None):
+    """Compare a list of tokens with the next len(tokens) tokens of expected_iter."""
+    if not tokens:
+        return True
+    expected = list(itertools.islice(expected_iter, len(tokens)))
+    if len(expected) != len(tokens):
+        return False
+    if tokens == expected:
+        return True
+    if float_tolerance is None:
+        return False
+    return all(a == b or _tokens_close(a, b, float_tolerance) for a, b in zip(tokens, expected))
+
+
+def compare_outputs(user_output, expected_output, float_tolerance=None, case_sensitive=True):
     """
     Compare user output with expected output using token-based comparison.
+    Works on bytes (str is encoded) without building the full token lists:
+    identical text is a single memory compare, otherwise both buffers are
+    tokenized block by block and the walk stops at the first mismatching block.
     
     Args:
-        user_output: Output from user's program
-        expected_output: Expected output from test case
+        user_output: Output from user's program (str or bytes)
+        expected_output: Expected output from test case (str or bytes)
+        float_tolerance: If set, numeric tokens match when they differ by at
+            most float_tolerance (absolute, or relative for values above 1)
+        case_sensitive: False to compare tokens ignoring ASCII case
         
     Returns:
         True if outputs match (ignoring extra whitespace), False otherwise
     """
-    user_tokens = get_tokens(user_output)
-    expected_tokens = get_tokens(expected_output)
-    return user_tokens == expected_tokens
+    user = _as_bytes(user_output)
+    expected = _as_bytes(expected_output)
+    if case_sensitive and _same_content(user, expected):
+        return True
+    lower = not case_sensitive
+    expected_iter = itertools.chain.from_iterable(_token_blocks(expected, lower))
+    for tokens in _token_blocks(user, lower):
+        if not _match_tokens(tokens, expected_iter, float_tolerance):
+            return False
+    return next(expected_iter, None) is None
 
 
 def check_verdict_with_checker(checker_module, test_input, user_output, expected_output):
@@ -58,7 +491,7 @@ def check_verdict_with_checker(checker_module, test_input, user_output, expected
     try:
         # Suppress checker's stdout to prevent JSON corruption
         f_dummy = io.StringIO()
-        with redirect_stdout(f_dummy):
+        with _checker_lock, redirect_stdout(f_dummy):
             is_ok = checker_module.check(test_input, user_output, expected_output)
         
         verdict = "Accepted" if is_ok else "Wrong Answer"
@@ -4,23 +4,10 @@ import json
 import subprocess
 import time
 import traceback
-import io
-from contextlib import redirect_stdout
 
-# Import shared utilities
-try:
-    from judge_utils import get_tokens, compare_outputs, check_verdict_with_checker
-    HAS_JUDGE_UTILS = True
-except ImportError:
-    HAS_JUDGE_UTILS = False
-    # Fallback implementation if judge_utils is not available
-    def get_tokens(text):
-        if not text:
-            return []
-        return text.strip().split()
-    
-    def compare_outputs(user_output, expected_output):
-        return get_tokens(user_output) == get_tokens(expected_output)
+# Shared utilities (judge_utils.py is always copied next to the runner)
+from judge_utils import (check_verdict_with_checker, load_judge_options, load_tests,
+                         read_test_file, run_tests, run_limited, emit_result, emit_done)
 
 # Пытаемся импортировать чекер, если он есть
 try:
@@ -30,19 +17,24 @@ except ImportError:
     HAS_CHECKER = False
 
 def run_judge():
-    results = []
+    options = load_judge_options()
     
     # Читаем тесты
     try:
-        with open('tests.json', 'r') as f:
-            tests = json.load(f)
+        tests = load_tests(options.get('tests_dir', 'tests'))
     except Exception as e:
-        print(json.dumps([{"verdict": "Internal Error", "error": f"Failed to read tests.json: {e}"}]))
+        print(json.dumps([{"verdict": "Internal Error", "error": f"Failed to read tests: {e}"}]))
         return
 
-    for i, test in enumerate(tests):
-        test_input = test.get('input', '')
-        expected_output = test.get('output', '')
+    # Лимит вывода программы (байт stdout на тест), дальше - Output Limit Exceeded
+    output_limit = int(options.get('output_limit', 64 * 1024 * 1024))
+    # Лимит памяти на тест (байт), отдельно для каждого запуска программы
+    memory_limit = int(options.get('memory_limit', 512 * 1024 * 1024))
+    # Режимы сравнения без чекера: допуск для вещественных чисел, без учета регистра
+    compare_modes = {"float_tolerance": options.get('float_tolerance'),
+                     "case_sensitive": not options.get('case_insensitive', False)}
+
+    def judge_test(i, test):
         # Используем жесткий лимит
         time_limit = float(test.get('limit', 1.0))
         cmd_timeout = time_limit 
@@ -52,73 +44,76 @@ def run_judge():
             
             # Запуск решения студента
             # Используем системный timeout для надежности процесса
-            process = subprocess.run(
-                ['timeout', str(cmd_timeout), 'python3', '-u', 'script.py'],
-                input=test_input.encode('utf-8'),
-                capture_output=True,
-                # Даем Python чуть больше времени, чтобы он успел поймать код возврата timeout (124)
-                timeout=cmd_timeout + 0.5 
-            )
+            # Вход подается прямо из файла теста, без чтения в память.
+            # Без чекера вывод сверяется с эталоном на лету и целиком не хранится
+            with open(test['input_path'], 'rb') as stdin_file:
+                process = run_limited(
+                    ['timeout', str(cmd_timeout), 'python3', '-u', 'script.py'],
+                    stdin_file,
+                    # Даем Python чуть больше времени, чтобы он успел поймать код возврата timeout (124)
+                    timeout=cmd_timeout + 0.5,
+                    output_limit=output_limit,
+                    memory_limit=memory_limit,
+                    answer_path=None if HAS_CHECKER else test['answer_path'],
+                    **compare_modes
+                )
             
-            output = process.stdout.decode('utf-8', errors='replace')
-            error = process.stderr.decode('utf-8', errors='replace')
-            return_code = process.returncode
+            output = process["output"]
+            error = process["error"]
+            return_code = process["returncode"]
             
             verdict = ""
             
-            if return_code == 124: # Код возврата timeout в Linux
+            if process["output_limit_exceeded"]:
+                verdict = "Output Limit Exceeded"
+            elif return_code == 124: # Код возврата timeout в Linux
                 verdict = "Time Limit Exceeded"
             elif return_code != 0:
                 verdict = "Runtime Error"
             else:
                 # Проверка ответа
                 if HAS_CHECKER:
-                    if HAS_JUDGE_UTILS:
-                        verdict, checker_error = check_verdict_with_checker(
-                            checker, test_input, output, expected_output
-                        )
-                        if checker_error:
-                            error += checker_error
-                    else:
-                        # Fallback to original implementation
-                        try:
-                            f_dummy = io.StringIO()
-                            with redirect_stdout(f_dummy):
-                                is_ok = checker.check(test_input, output, expected_output)
-                            verdict = "Accepted" if is_ok else "Wrong Answer"
-                        except Exception as check_err:
-                            verdict = "Judge Error"
-                            error += f"\nChecker failed: {check_err}"
+                    # Эталон и вход читаются с диска только для чекера
+                    expected_output = read_test_file(test['answer_path'])
+                    test_input = read_test_file(test['input_path'])
+                    verdict, checker_error = check_verdict_with_checker(
+                        checker, test_input, output, expected_output
+                    )
+                    if checker_error:
+                        error += checker_error
                 else:
-                    if compare_outputs(output, expected_output):
-                        verdict = "Accepted"
-                    else:
-                        verdict = "Wrong Answer"
+                    verdict = "Accepted" if process["matched"] else "Wrong Answer"
             
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": verdict,
-                "output": output,
+                "output": process["preview"],
                 "error": error
-            })
+            }
 
         except subprocess.TimeoutExpired:
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": "Time Limit Exceeded",
                 "output": "",
                 "error": "Judge subprocess timeout"
-            })
+            }
         except Exception as e:
-            results.append({
+            return {
                 "test_num": i + 1,
                 "verdict": "Internal Error",
                 "output": "",
                 "error": str(e)
-            })
+            }
+
+    # Параллельный прогон: тесты делятся между потоками, порядок результатов сохраняется
+    # stop_on_failure: для ICPC/all_or_nothing прекращаем после первого непройденного теста
+    results = run_tests(tests, judge_test, workers=int(options.get('workers', 1)),
+                        stop_on_failure=bool(options.get('stop_on_failure', False)),
+                        on_result=emit_result)
 
-    # Выводим JSON с результатами в stdout (его читает Synaqmaker)
-    print(json.dumps(results))
+    # Результаты тестов уже отправлены построчно, завершаем протокол (его читает Synaqmaker)
+    emit_done(results)
 
 if __name__ == "__main__":
     run_judge()
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Удаленный проверяющий воркер.
+
+Запускается на любой машине в сети с Docker и собранными образами:
+    python judge_worker.py --server http://192.168.1.10:5000 --slots 8
+
+Воркер регистрируется на сервере, забирает посылки (по одному запросу
+на свободный слот), проверяет их локально тем же _run_batch и отправляет
+вердикты обратно. Токен берется из config.ini ([server] WORKER_TOKEN)
+или из аргумента --token.
+"""
+import argparse
+import configparser
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from db_manager import (run_python, run_cpp, run_csharp, container_pool, compile_cache, test_set_store,
+                        set_output_limit, DOCKER_IMAGE_PYTHON, DOCKER_IMAGE_CPP, DOCKER_IMAGE_CSHARP)
+
+RUNNERS = {
+    'Python': run_python,
+    'C++': run_cpp,
+    'C#': run_csharp
+}
+
+RETRY_DELAY = 3
+
+
+class WorkerNotRegistered(Exception):
+    pass
+
+
+class JudgeWorker:
+    def __init__(self, server, token, slots, name):
+        self.server = server.rstrip('/')
+        self.token = token
+        self.slots = slots
+        self.name = name
+        self.worker_id = None
+        self.heartbeat_interval = 5
+        self.register_lock = threading.Lock()
+
+    def _post(self, path, payload, timeout=30):
+        req = urllib.request.Request(
+            self.server + path,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-Worker-Token': self.token},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise WorkerNotRegistered()
+            raise
+
+    def register(self, stale_id=None):
+        """Регистрация (повторная - только если stale_id все еще текущий)."""
+        with self.register_lock:
+            if self.worker_id and self.worker_id != stale_id:
+                return
+            while True:
+                try:
+                    data = self._post('/worker/api/register', {'name': self.name, 'slots': self.slots})
+                    self.worker_id = data['worker_id']
+                    self.heartbeat_interval = data.get('heartbeat_interval', 5)
+                    print(f"WORKER: Зарегистрирован на {self.server} как {self.name} ({self.slots} слотов)")
+                    return
+                except Exception as e:
+                    print(f"WORKER: Сервер недоступен ({e}), повтор через {RETRY_DELAY} с")
+                    time.sleep(RETRY_DELAY)
+
+    def _call(self, path, payload, timeout=30):
+        worker_id = self.worker_id
+        try:
+            return self._post(path, dict(payload, worker_id=worker_id), timeout=timeout)
+        except WorkerNotRegistered:
+            self.register(stale_id=worker_id)
+            raise
+
+    def heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self._call('/worker/api/heartbeat', {}, timeout=10)
+            except Exception as e:
+                print(f"WORKER: Heartbeat не прошел: {e}")
+
+    def run_job(self, job):
+        runner = RUNNERS.get(job.get('language'))
+        if not runner:
+            return [{"verdict": "Internal Error", "error": f"Language {job.get('language')} is not supported"}], None
+        try:
+            return runner(job['code'], job['tests'], checker_code=job.get('checker_code'),
+                          workers=int(job.get('workers', 1)),
+                          stop_on_failure=bool(job.get('stop_on_failure', False)),
+                          test_set_id=job.get('test_set_id'))
+        except Exception as e:
+            return [{"verdict": "Internal Error", "error": str(e)}], None
+
+    def slot_loop(self):
+        while True:
+            try:
+                data = self._call('/worker/api/pull', {}, timeout=60)
+            except Exception as e:
+                if not isinstance(e, WorkerNotRegistered):
+                    print(f"WORKER: Ошибка получения задания: {e}")
+                    time.sleep(RETRY_DELAY)
+                continue
+
+            job = data.get('job')
+            if not job:
+                continue
+
+            verdicts, global_err = self.run_job(job)
+            try:
+                self._call('/worker/api/result', {
+                    'job_id': job['job_id'],
+                    'verdicts': verdicts,
+                    'global_err': global_err
+                })
+            except Exception as e:
+                # Сервер вернет посылку в очередь по дедлайну задания (или если сочтет воркер потерянным)
+                print(f"WORKER: Не удалось отправить результат: {e}")
+
+    def start(self):
+        self.register()
+        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+        threads = [threading.Thread(target=self.slot_loop, daemon=True) for _ in range(self.slots)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read('config.ini', encoding='utf-8')
+
+    parser = argparse.ArgumentParser(description="Удаленный воркер проверки Synaqmaker")
+    parser.add_argument('--server', default=config.get('worker', 'SERVER_URL', fallback='http://127.0.0.1:5000'))
+    parser.add_argument('--token', default=config.get('server', 'WORKER_TOKEN', fallback=''))
+    parser.add_argument('--slots', type=int, default=config.getint('worker', 'SLOTS', fallback=4))
+    parser.add_argument('--name', default=socket.gethostname())
+    parser.add_argument('--no-pool', action='store_true', help="Не использовать пул тёплых контейнеров")
+    args = parser.parse_args()
+
+    if not args.token:
+        print("ERROR: Не задан WORKER_TOKEN (config.ini [server] или --token)")
+        return
+
+    compile_cache.configure(config.getint('server', 'COMPILE_CACHE_MB', fallback=256))
+    test_set_store.configure(config.getint('server', 'TEST_DATA_MB', fallback=1024))
+    set_output_limit(config.getint('server', 'OUTPUT_LIMIT_MB', fallback=64))
+    if not args.no_pool:
+        container_pool.configure(args.slots)
+        threading.Thread(target=container_pool.warm_up,
+                         args=([DOCKER_IMAGE_PYTHON, DOCKER_IMAGE_CPP, DOCKER_IMAGE_CSHARP], args.slots),
+                         daemon=True).start()
+
+    try:
+        JudgeWorker(args.server, args.token, max(1, args.slots), args.name).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        container_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
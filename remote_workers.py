@@ -0,0 +1,141 @@
+"""
+Реестр удаленных проверяющих машин (judge_worker.py).
+
+Воркер регистрируется, держит long-poll запросы на получение заданий
+(по одному на свободный слот) и присылает вердикты обратно.
+Если воркер пропал (нет heartbeat дольше timeout), все его задания
+завершаются ошибкой WorkerLost, и сервер ставит посылки в очередь заново.
+То же происходит с заданием, не вернувшимся до своего дедлайна.
+"""
+import hmac
+import time
+import uuid
+from threading import Lock
+
+from gevent import Timeout
+from gevent.event import AsyncResult
+from gevent.queue import Queue, Empty
+
+
+class WorkerLost(Exception):
+    """Удаленный воркер перестал отвечать, не вернув результат."""
+
+
+class RemoteWorker:
+    def __init__(self, name, slots, address):
+        self.worker_id = uuid.uuid4().hex
+        self.name = name
+        self.slots = slots
+        self.address = address
+        self.last_seen = time.time()
+        self.outbox = Queue()       # Задания, ожидающие получения воркером
+        self.in_flight = {}         # job_id -> AsyncResult
+        self.completed = 0
+
+    @property
+    def running(self):
+        return len(self.in_flight)
+
+    def info(self):
+        return {
+            'worker_id': self.worker_id,
+            'name': self.name,
+            'address': self.address,
+            'slots': self.slots,
+            'running': self.running,
+            'completed': self.completed,
+            'last_seen': round(time.time() - self.last_seen, 1),
+        }
+
+
+class RemoteWorkerRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        self.workers = {}
+        self.token = ""
+        self.timeout = 15
+
+    @property
+    def enabled(self):
+        return bool(self.token)
+
+    def configure(self, token, timeout=15):
+        self.token = token or ""
+        self.timeout = max(3, int(timeout))
+
+    def check_token(self, token):
+        # Сравнение за постоянное время, чтобы токен нельзя было подобрать по таймингу
+        return self.enabled and hmac.compare_digest(str(token).encode(), self.token.encode())
+
+    def register(self, name, slots, address):
+        worker = RemoteWorker(name, max(1, int(slots)), address)
+        with self.lock:
+            self.workers[worker.worker_id] = worker
+        print(f"WORKERS: Подключен {name} ({address}), слотов: {worker.slots}")
+        return worker
+
+    def get(self, worker_id):
+        """Возвращает воркера и обновляет время последнего контакта."""
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker:
+                worker.last_seen = time.time()
+            return worker
+
+    def execute(self, worker, payload, deadline=None):
+        """
+        Отдает задание воркеру и ждет результат (verdicts, global_err).
+        Бросает WorkerLost, если воркер отключился или не уложился в deadline секунд.
+        """
+        job_id = uuid.uuid4().hex
+        result = AsyncResult()
+        with self.lock:
+            if worker.worker_id not in self.workers:
+                raise WorkerLost(worker.name)
+            worker.in_flight[job_id] = result
+        worker.outbox.put(dict(payload, job_id=job_id))
+        try:
+            return result.get(timeout=deadline)
+        except Timeout:
+            # Воркер жив (шлет heartbeat), но задание завис - забираем его,
+            # поздний результат complete() просто отклонит
+            with self.lock:
+                worker.in_flight.pop(job_id, None)
+            print(f"WORKERS: {worker.name} не вернул задание за {deadline:.0f} с, оно возвращается в очередь")
+            raise WorkerLost(worker.name)
+
+    def next_job(self, worker, timeout):
+        try:
+            return worker.outbox.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def complete(self, worker, job_id, verdicts, global_err):
+        with self.lock:
+            result = worker.in_flight.pop(job_id, None)
+            if result is None:
+                return False
+            worker.completed += 1
+        result.set((verdicts, global_err))
+        return True
+
+    def reap(self):
+        """Удаляет молчащих воркеров, их задания завершаются WorkerLost."""
+        now = time.time()
+        with self.lock:
+            dead = [w for w in self.workers.values() if now - w.last_seen > self.timeout]
+            for worker in dead:
+                del self.workers[worker.worker_id]
+        for worker in dead:
+            print(f"WORKERS: {worker.name} не отвечает, заданий возвращено в очередь: {worker.running}")
+            for result in worker.in_flight.values():
+                result.set_exception(WorkerLost(worker.name))
+            worker.in_flight.clear()
+        return len(dead)
+
+    def snapshot(self):
+        with self.lock:
+            return [w.info() for w in self.workers.values()]
+
+
+remote_workers = RemoteWorkerRegistry()
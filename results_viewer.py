@@ -1,12 +1,40 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import sqlite3
-import json
 import pandas as pd
 import re
+import zlib
 
 DB_NAME = "testirovschik.db"
 
+def load_task_scores(conn, olympiad_id=None):
+    """
+    Баллы из olympiad_task_scores: {(olympiad_id, participant_uuid): {"task_id": {...}}}.
+    Ключи задач - строки, как раньше в JSON.
+    """
+    query = "SELECT olympiad_id, participant_uuid, task_id, score, attempts, passed, penalty FROM olympiad_task_scores"
+    params = ()
+    if olympiad_id is not None:
+        query += " WHERE olympiad_id = ?"
+        params = (olympiad_id,)
+    result = {}
+    for o_id, uuid, task_id, score, attempts, passed, penalty in conn.execute(query, params):
+        result.setdefault((o_id, uuid), {})[str(task_id)] = {
+            'score': score, 'attempts': attempts, 'passed': bool(passed), 'penalty': penalty
+        }
+    return result
+
+def load_task_code(conn, olympiad_id, participant_uuid):
+    """Последний код участника по задачам из olympiad_task_code: {"task_id": код}."""
+    result = {}
+    for task_id, code, compressed in conn.execute(
+            "SELECT task_id, code, compressed FROM olympiad_task_code WHERE olympiad_id = ? AND participant_uuid = ?",
+            (olympiad_id, participant_uuid)):
+        if compressed:
+            code = zlib.decompress(code).decode('utf-8')
+        result[str(task_id)] = code or ""
+    return result
+
 class ResultsViewer(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -93,7 +121,10 @@ class ResultsViewer(tk.Tk):
             conn = self.db_connect()
             cursor = conn.cursor()
             cursor.execute("DELETE FROM olympiad_results WHERE olympiad_id = ?", (olympiad_id,))
+            cursor.execute("DELETE FROM olympiad_task_scores WHERE olympiad_id = ?", (olympiad_id,))
             cursor.execute("DELETE FROM olympiad_submissions WHERE olympiad_id = ?", (olympiad_id,))
+            cursor.execute("DELETE FROM olympiad_task_code WHERE olympiad_id = ?", (olympiad_id,))
+            cursor.execute("DELETE FROM olympiad_code_history WHERE olympiad_id = ?", (olympiad_id,))
             conn.commit()
             conn.close()
             
@@ -129,19 +160,19 @@ class ResultsViewer(tk.Tk):
         conn = self.db_connect()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT participant_uuid, nickname, total_score, task_scores 
+            SELECT participant_uuid, nickname, total_score 
             FROM olympiad_results WHERE olympiad_id = ?
         """, (self.selected_olympiad_id,))
         results = cursor.fetchall()
+        scores_map = load_task_scores(conn, self.selected_olympiad_id)
         conn.close()
 
         if not results: return
 
         # 1. Анализируем первую запись, чтобы понять структуру (ICPC или простая)
-        try:
-            first_scores = json.loads(results[0][3])
-        except:
-            return # Битая JSON строка
+        first_scores = scores_map.get((self.selected_olympiad_id, results[0][0]))
+        if not first_scores:
+            return
 
         # Собираем ID задач
         task_ids = sorted(first_scores.keys(), key=lambda x: int(x) if x.isdigit() else x)
@@ -184,8 +215,8 @@ class ResultsViewer(tk.Tk):
         # 3. Обрабатываем и добавляем данные
         parsed_rows = []
         for row in results:
-            uuid, nickname, db_total, scores_json = row
-            scores = json.loads(scores_json)
+            uuid, nickname, db_total = row
+            scores = scores_map.get((self.selected_olympiad_id, uuid), {})
             
             row_data = [nickname]
             
@@ -247,14 +278,10 @@ class ResultsViewer(tk.Tk):
         for tab in self.task_notebook.tabs(): self.task_notebook.forget(tab)
 
         conn = self.db_connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT task_submissions FROM olympiad_submissions WHERE olympiad_id = ? AND participant_uuid = ?",
-                       (self.selected_olympiad_id, participant_uuid))
-        res = cursor.fetchone()
+        submissions = load_task_code(conn, self.selected_olympiad_id, participant_uuid)
         conn.close()
 
-        if not res: return
-        submissions = json.loads(res[0])
+        if not submissions: return
         
         task_ids = sorted(submissions.keys(), key=lambda x: int(x) if x.isdigit() else x)
         letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
@@ -275,6 +302,7 @@ class ResultsViewer(tk.Tk):
         try:
             conn = self.db_connect()
             df = pd.read_sql_query("SELECT * FROM olympiad_results", conn)
+            scores_map = load_task_scores(conn)
             conn.close()
             
             if df.empty: return
@@ -287,7 +315,7 @@ class ResultsViewer(tk.Tk):
                     export_data = []
                     
                     for _, row in group.iterrows():
-                        scores = json.loads(row['task_scores'])
+                        scores = scores_map.get((o_id, row['participant_uuid']), {})
                         # Пытаемся понять ICPC ли это
                         is_icpc = False
                         if scores and isinstance(list(scores.values())[0], dict) and 'penalty' in list(scores.values())[0]:
@@ -12,7 +12,8 @@ import subprocess
 import configparser
 import socket
 import gevent
-from app import app, socketio, submission_worker, restore_state_on_startup
+from app import app, socketio, submission_worker, remote_worker_reaper, restore_state_on_startup, container_pool, WARM_CONTAINERS, persistence
+import atexit
 
 # --- 1. НАСТРОЙКА ЛОГИРОВАНИЯ ---
 if not os.path.exists('logs'):
@@ -82,7 +83,7 @@ def cleanup_zombies():
 # --- 4. АВТО-ЗАПУСК ОЛИМПИАД ---
 def auto_starter():
     """Проверяет запланированные олимпиады."""
-    from app import olympiad_lock, olympiads, db 
+    from app import olympiad_lock, olympiads, db, _get_olympiad_lock, _prewarm_judge_data
     print("INFO: Планировщик олимпиад запущен.")
     
     while True:
@@ -103,8 +104,10 @@ def auto_starter():
                     print(f"AUTO-START: Запуск запланированной олимпиады {oid}")
                     
                     # Обновляем память
-                    olympiads[oid]['status'] = 'running'
-                    olympiads[oid]['start_time'] = current_ts # Обновляем стартовое время
+                    with _get_olympiad_lock(oid):
+                        olympiads[oid]['status'] = 'running'
+                        olympiads[oid]['start_time'] = current_ts # Обновляем стартовое время
+                    _prewarm_judge_data(olympiads[oid]['task_ids'])
                     # Сохраняем старт в БД!
                     try:
                         db.set_olympiad_start_time(oid, current_ts)
@@ -139,9 +142,19 @@ if __name__ == "__main__":
     cleanup_zombies()
     restore_state_on_startup()
     
+    # Прогрев пула контейнеров (в фоне, чтобы не задерживать старт сервера)
+    gevent.spawn(container_pool.warm_up,
+                 ["testirovschik-python", "testirovschik-cpp", "testirovschik-csharp"],
+                 WARM_CONTAINERS)
+    atexit.register(container_pool.shutdown)
+    # Несохраненные результаты (write-behind) пишутся в БД при остановке
+    atexit.register(persistence.flush)
+    
     # Запуск фоновых задач
     #gevent.spawn(backup_scheduler)
     gevent.spawn(submission_worker)
+    gevent.spawn(remote_worker_reaper)
+    gevent.spawn(persistence.run)
     gevent.spawn(auto_starter)
     
     local_ip = get_local_ip()
@@ -0,0 +1,70 @@
+"""
+Инкрементальный индекс мест для таблицы результатов.
+
+Хранит готовую строку каждого участника и отсортированный список ключей.
+Один вердикт меняет одну строку: старый ключ находится бинарным поиском и
+удаляется, новый вставляется на свое место. Место участника и топ-N - тоже
+бинарный поиск / срез, без пересортировки всей таблицы.
+
+Порядок совпадает с прежней сортировкой:
+- ICPC: решено (по убыванию), штраф (по возрастанию);
+- баллы: сумма баллов (по убыванию);
+при равенстве - порядок добавления участника.
+"""
+from bisect import bisect_left, insort
+
+
+class RankingIndex:
+    def __init__(self, scoring_mode):
+        self.scoring_mode = scoring_mode
+        self.entries = []       # отсортированные (ключ..., порядковый номер, participant_id)
+        self.rows = {}          # participant_id -> строка таблицы
+        self.entry_of = {}      # participant_id -> его текущий элемент в entries
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, participant_id):
+        return participant_id in self.rows
+
+    def _make_entry(self, participant_id, row, order):
+        if self.scoring_mode == 'icpc':
+            return (-row['total_score'], row['total_penalty'], order, participant_id)
+        return (-row['total_score'], order, participant_id)
+
+    def _drop_entry(self, participant_id):
+        entry = self.entry_of.pop(participant_id, None)
+        if entry is not None:
+            del self.entries[bisect_left(self.entries, entry)]
+        return entry
+
+    def update(self, participant_id, row):
+        """Добавляет или перемещает участника."""
+        old = self._drop_entry(participant_id)
+        if old is not None:
+            order = old[-2]
+        else:
+            order = self.next_order
+            self.next_order += 1
+        entry = self._make_entry(participant_id, row, order)
+        insort(self.entries, entry)
+        self.entry_of[participant_id] = entry
+        self.rows[participant_id] = row
+
+    def remove(self, participant_id):
+        self._drop_entry(participant_id)
+        self.rows.pop(participant_id, None)
+
+    def rank(self, participant_id):
+        """Место участника (с 0) или None."""
+        entry = self.entry_of.get(participant_id)
+        if entry is None:
+            return None
+        return bisect_left(self.entries, entry)
+
+    def top(self, n):
+        return [self.rows[entry[-1]] for entry in self.entries[:n]]
+
+    def ordered_rows(self):
+        return [self.rows[entry[-1]] for entry in self.entries]
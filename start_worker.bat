@@ -0,0 +1,18 @@
+@echo off
+title Synaqmaker - JUDGE WORKER
+color 0B
+echo.
+echo ==================================================
+echo.
+echo  Starting "SYNAQMAKER" judge worker
+echo  Server address and slots: config.ini, section [worker]
+echo  If you want to stop the worker - just close this window.
+echo.
+echo ==================================================
+echo.
+
+python judge_worker.py %*
+
+echo.
+echo Worker stopped.
+pause
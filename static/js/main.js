@@ -120,7 +120,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 const overallStatus = data.passed_count === data.total_tests ? 'success' : 'danger';
                 let resultsHTML = `
                     <div class="alert alert-${overallStatus}">
-                        <h4 class="alert-heading">Результат: ${data.passed_count} из ${data.total_tests} тестов пройдено.</h4>
+                        <h4 class="alert-heading">Результат: ${data.passed_count} из ${data.total_tests} тестов пройдено.${data.cached ? ' <span class="badge bg-secondary">из кэша</span>' : ''}</h4>
                     </div>
                 `;
 
@@ -0,0 +1,57 @@
+// Синхронизация таблицы с сервером по дельтам.
+// Сервер присылает снимок full_status_update (view, seq) при входе в комнату,
+// затем только scoreboard_delta: измененные строки, новые места и поля состояния.
+// Здесь из дельт собирается полное состояние в прежнем формате и отдается в onState.
+// При пропуске номера версии запрашивается новый снимок (request_resync).
+function attachScoreboardSync(socket, room, view, onState) {
+    let state = null;
+    let seq = 0;
+    let rows = new Map();   // participant_id -> строка таблицы
+    let ranks = new Map();  // participant_id -> место (с 0)
+
+    function resync() {
+        state = null;
+        socket.emit('request_resync', { room: room, view: view });
+    }
+
+    function rebuildScoreboard() {
+        const board = Array.from(rows.values());
+        board.sort((a, b) => ranks.get(a.participant_id) - ranks.get(b.participant_id));
+        // Места должны быть 0..n-1 без повторов, иначе состояние разошлось с сервером
+        for (let i = 0; i < board.length; i++) {
+            if (ranks.get(board[i].participant_id) !== i) return null;
+        }
+        return board;
+    }
+
+    socket.on('full_status_update', (data) => {
+        // Снимки приходят только этому сокету; сервер может понизить view до public
+        if (data.view) view = data.view;
+        state = data;
+        seq = data.seq || 0;
+        rows = new Map();
+        ranks = new Map();
+        (data.scoreboard || []).forEach((p, i) => {
+            rows.set(p.participant_id, p);
+            ranks.set(p.participant_id, i);
+        });
+        onState(state);
+    });
+
+    socket.on('scoreboard_delta', (delta) => {
+        if (delta.view !== view || !state) return;
+        if (delta.seq <= seq) return;             // Уже учтено в снимке
+        if (delta.seq !== seq + 1) { resync(); return; }
+
+        (delta.removed || []).forEach(pid => { rows.delete(pid); ranks.delete(pid); });
+        (delta.rows || []).forEach(p => rows.set(p.participant_id, p));
+        for (const pid in (delta.ranks || {})) ranks.set(pid, delta.ranks[pid]);
+
+        const board = rebuildScoreboard();
+        if (!board) { resync(); return; }
+
+        seq = delta.seq;
+        state = { ...state, ...(delta.meta || {}), scoreboard: board, seq: seq };
+        onState(state);
+    });
+}
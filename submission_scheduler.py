@@ -0,0 +1,82 @@
+"""
+Планировщик проверок вместо простой FIFO-очереди.
+
+- Админская полоса (запуски /run_code) обслуживается первой.
+- Первые посылки участника по задаче идут раньше повторных; первой считается
+  только одна посылка, пока по задаче нет вердикта и других посылок в очереди.
+- Внутри полосы участники обслуживаются по кругу (round-robin),
+  поэтому один участник с пачкой посылок не задерживает остальных.
+"""
+from collections import OrderedDict, deque
+from threading import Condition
+
+LANE_ADMIN = 'admin'
+LANE_CONTEST = 'contest'
+
+# Порядок обслуживания полос: админ -> первые посылки -> повторные
+_TIER_ORDER = ('admin', 'first', 'retry')
+
+
+class SubmissionScheduler:
+    def __init__(self):
+        self.cond = Condition()
+        # tier -> OrderedDict(owner -> deque(items)); порядок ключей = очередь round-robin
+        self.tiers = {tier: OrderedDict() for tier in _TIER_ORDER}
+        self.size = 0
+
+    def _tier_for(self, item, lane):
+        if lane == LANE_ADMIN:
+            return 'admin'
+        return 'first' if item.get('first_attempt') else 'retry'
+
+    def put(self, item, lane=LANE_CONTEST, owner=None):
+        """
+        Добавляет задание. owner - ключ справедливой очереди
+        (по умолчанию participant_id из item).
+        """
+        tier = self._tier_for(item, lane)
+        if owner is None:
+            owner = item.get('participant_id')
+        with self.cond:
+            owners = self.tiers[tier]
+            if owner not in owners:
+                owners[owner] = deque()
+            owners[owner].append(item)
+            self.size += 1
+            self.cond.notify_all()
+
+    def _pop(self, tiers):
+        for tier in tiers:
+            owners = self.tiers[tier]
+            if not owners:
+                continue
+            owner, items = owners.popitem(last=False)
+            item = items.popleft()
+            if items:
+                # Участник уходит в конец круга
+                owners[owner] = items
+            self.size -= 1
+            return item
+        return None
+
+    def _count(self, tiers):
+        return sum(len(items) for tier in tiers for items in self.tiers[tier].values())
+
+    def get(self, timeout=None, contest_only=False):
+        """
+        Блокируется, пока нет заданий. Возвращает None по таймауту.
+        contest_only - не брать админские запуски (для удаленных воркеров).
+        """
+        tiers = _TIER_ORDER[1:] if contest_only else _TIER_ORDER
+        with self.cond:
+            if not self._count(tiers):
+                self.cond.wait_for(lambda: self._count(tiers) > 0, timeout)
+            return self._pop(tiers)
+
+    def qsize(self):
+        with self.cond:
+            return self.size
+
+    def lane_sizes(self):
+        with self.cond:
+            return {tier: self._count((tier,)) for tier in _TIER_ORDER}